@@ -21,3 +21,9 @@ st.write("- To manage employee data, click **'👥Employee'**. ")
 st.write("- To view evaluation insights, click **'📊Employee Dashboard'** or **'🏢Company Dashboard'**. ")
 st.write("- To customize the evaluation form, click **'⚙️Admin'**")
 st.caption("ในการกรอกแบบฟอร์มประเมิน ให้คลิก **'📝Form'** หากต้องการจัดการข้อมูลพนักงาน ให้คลิก **'👥Employee'** หากต้องการดูผลการประเมินเชิงลึก ให้คลิก **'📊Employee Dashboard'** หรือ **'🏢Company Dashboard'** และหากต้องการปรับแต่งแบบฟอร์มประเมินให้คลิก **'⚙️Admin'**")
+
+# The page above is static and paints before the data modules are imported below
+from utils import api, tenants, warmup
+
+api.serve_in_background()
+warmup.start(tenants.current_data_dir())
@@ -1,22 +1,10 @@
 import streamlit as st 
 import pandas as pd
-import os
-import json
+from utils import storage, tenants, warmup
 
 # Config
-CONFIG_FILE = "config.json"
-
-def load_config():
-    if not os.path.exists(CONFIG_FILE):
-        default_config = {"use_custom": False}
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(default_config, f)
-        return default_config
-    else:
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-
-config = load_config()
+data_dir = tenants.current_data_dir()
+config = storage.load_config(data_dir)
 use_custom = config.get("use_custom", False)
 
 # UI Header
@@ -28,9 +16,8 @@ st.caption("- แบบประเมินพนักงานนี้ออ
 st.write("___")
 
 # Load data
-employee_df = pd.read_csv("employee_info.csv")
-criteria_file = "custom_criteria.csv" if use_custom else "criteria_config.csv"
-criteria_config = pd.read_csv(criteria_file)
+employee_df = storage.load_employees(data_dir)
+criteria_config = storage.load_criteria(data_dir, use_custom)
 
 # Select employee
 departments = sorted(employee_df["department"].unique())
@@ -65,7 +52,7 @@ with st.form("evaluation_form"):
         crit = row["criteria"]
         caption_eng = row.get("caption_eng", crit)
         caption_th = row.get("caption_th", "")
-        q_type = row.get("type", "rating").strip().lower()
+        q_type = row["type"]
 
         st.markdown(f"**{caption_eng}**")
         st.caption(caption_th)
@@ -98,7 +85,8 @@ with st.form("evaluation_form"):
             "type": typ,
             "score": score,
             "value": value,
-            "text_response": text_response
+            "text_response": text_response,
+            "department": department
         })
 
     submitted = st.form_submit_button("✅ Submit / ส่งแบบประเมิน")
@@ -106,12 +94,11 @@ with st.form("evaluation_form"):
 # Save data
 if submitted:
     new_data = pd.DataFrame(responses)
-
-    if os.path.exists("evaluation_data.csv"):
-        old_data = pd.read_csv("evaluation_data.csv")
-        updated_data = pd.concat([old_data, new_data], ignore_index=True)
-    else:
-        updated_data = new_data
-
-    updated_data.to_csv("evaluation_data.csv", index=False)
-    st.success("✅ Data saved successfully! / บันทึกข้อมูลเสร็จสิ้น")
+    try:
+        storage.append_evaluations(data_dir, new_data)
+        st.success("✅ Data saved successfully! / บันทึกข้อมูลเสร็จสิ้น")
+    except ValueError as e:
+        st.error(f"❌ Could not save evaluation: {e} / ไม่สามารถบันทึกผลการประเมินได้")
+
+# Once the form is shown, get the dashboards' modules and data ready in the background
+warmup.start(data_dir)
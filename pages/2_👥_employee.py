@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-import os
+from utils import storage, tenants, tombstones
 
 st.header("👥 Employee data (ข้อมูลพนักงาน)")
 st.write("- This application is designed to help you manage employee information viewing the list of employees, adding new entries, or deleting existing ones.")
@@ -8,10 +8,9 @@ st.caption("- แอปพลิเคชันนี้ถูกออกแบ
 st.write("___")
 
 # Load existing employee data
-if os.path.exists("employee_info.csv"):
-    employee_df = pd.read_csv("employee_info.csv")
-else:
-    employee_df = pd.DataFrame(columns=["employee_id", "name", "Department"])
+data_dir = tenants.current_data_dir()
+employee_df = storage.load_employees(data_dir)
+deleted_df = tombstones.load(data_dir)
 
 # Upload Excel file to add/replace employee data
 st.subheader("📤 Upload Employee Excel File")
@@ -26,6 +25,11 @@ if uploaded_file:
         # Check required columns
         required_cols = {"employee_id", "name", "department"}
         if required_cols.issubset(new_employee_df.columns):
+            # Deleted employees stay hidden until restored, even when uploaded again
+            deleted_ids = sorted(set(new_employee_df["employee_id"].astype(str)) & set(deleted_df["employee_id"]))
+            if deleted_ids:
+                st.warning(f"⚠️ These employees were deleted and stay hidden until restored below: {', '.join(deleted_ids)} "
+                           "/ พนักงานเหล่านี้ถูกลบแล้ว จะไม่แสดงจนกว่าจะกู้คืนด้านล่าง")
             # Confirm overwrite or append
             mode = st.radio(
                 "How do you want to handle the uploaded data?",
@@ -34,12 +38,12 @@ if uploaded_file:
             )
             if st.button("✅ Upload and Save / อัปโหลดและบันทึก"):
                 if mode == "Replace all existing data(แทนที่ข้อมูลพนักงานทั้งหมด)":
-                    new_employee_df.to_csv("employee_info.csv", index=False)
+                    storage.save_employees(data_dir, new_employee_df)
                     st.success("✅ Employee data replaced successfully! / ข้อมูลพนักงานถูกแทนที่เรียบร้อย")
                 else:  # Append
                     combined_df = pd.concat([employee_df, new_employee_df], ignore_index=True)
                     combined_df.drop_duplicates(subset=["employee_id"], keep="last", inplace=True)
-                    combined_df.to_csv("employee_info.csv", index=False)
+                    storage.save_employees(data_dir, combined_df)
                     st.success("✅ Employee data appended successfully! / ข้อมูลพนักงานถูกเพิ่มเรียบร้อย")
                 st.rerun()
         else:
@@ -96,6 +100,8 @@ if submitted:
         # Check for duplicate employee_id
         if new_id in employee_df["employee_id"].values:
             st.warning("⚠️ This employee ID is taken! / รหัสพนักงานนี้มีอยู่แล้ว!")
+        elif new_id in deleted_df["employee_id"].values:
+            st.warning("⚠️ This employee ID belongs to a deleted employee. Restore them below instead. / รหัสพนักงานนี้เป็นของพนักงานที่ถูกลบ กรุณากู้คืนด้านล่างแทน")
         else:
             new_row = pd.DataFrame([{
                 "employee_id": new_id,
@@ -103,7 +109,7 @@ if submitted:
                 "department": new_dept
             }])
             updated_df = pd.concat([employee_df, new_row], ignore_index=True)
-            updated_df.to_csv("employee_info.csv", index=False)
+            storage.save_employees(data_dir, updated_df)
             st.success("✅ Employee has been added! / เพิ่มพนักงานเรียบร้อยแล้ว!")
             st.rerun()
     else:
@@ -133,8 +139,9 @@ if not employee_df.empty:
         if st.button("❌ Delete / ลบ"):
             if confirm_delete:
                 emp_id = selected_emp.split("(")[-1].replace(")", "").strip()
-                updated_df = employee_df[employee_df["employee_id"] != emp_id]
-                updated_df.to_csv("employee_info.csv", index=False)
+                employee = employee_df[employee_df["employee_id"] == emp_id].iloc[-1]
+                # Their evaluations are hidden with them; the files are compacted in the background
+                tombstones.delete_employee(data_dir, emp_id, employee["name"], employee["department"])
                 st.success("✅ Employee has been deleted. / ลบพนักงานเรียบร้อยแล้ว!")
                 st.rerun()
             else:
@@ -143,3 +150,22 @@ if not employee_df.empty:
         st.warning("⚠️ There are no employees in this department. / ไม่มีพนักงานในแผนกนี้")
 else:
     st.warning("⚠️ No employee information yet / ยังไม่มีข้อมูลพนักงาน")
+
+st.write("___")
+
+# 4. Restore deleted employees
+st.subheader("♻️ Restore deleted employees")
+st.caption("> กู้คืนพนักงานที่ถูกลบพร้อมผลการประเมิน")
+
+if not deleted_df.empty:
+    st.dataframe(deleted_df[["employee_id", "name", "department", "deleted_at"]].sort_values(by="employee_id").reset_index(drop=True))
+    restore_options = deleted_df["name"].fillna("") + " (" + deleted_df["employee_id"] + ")"
+    selected_restore = st.selectbox("Select employee / เลือกพนักงาน", restore_options, key="restore_emp")
+
+    if st.button("♻️ Restore / กู้คืน"):
+        restore_id = selected_restore.split("(")[-1].replace(")", "").strip()
+        tombstones.restore_employee(data_dir, restore_id)
+        st.success("✅ Employee and their evaluations have been restored. / กู้คืนพนักงานและผลการประเมินเรียบร้อยแล้ว!")
+        st.rerun()
+else:
+    st.info("No deleted employees / ไม่มีพนักงานที่ถูกลบ")
@@ -1,45 +1,36 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import os
-import json
+from utils import aggregates, api, storage, tenants, trends
+from utils.export import render_export
 
-# Load configuration to check if custom criteria is enabled
-CONFIG_FILE = "config.json"
-DEFAULT_CRITERIA_FILE = "criteria_config.csv"
-CUSTOM_CRITERIA_FILE = "custom_criteria.csv"
+api.serve_in_background()
 
-# Fallback config
-config = {"use_custom": False}
-if os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-        config = json.load(f)
+# Load configuration to check if custom criteria is enabled
+data_dir = tenants.current_data_dir()
+config = storage.load_config(data_dir)
 
 use_custom = config.get("use_custom", False)
 
 # Load criteria file
-if use_custom and os.path.exists(CUSTOM_CRITERIA_FILE):
-    criteria_df = pd.read_csv(CUSTOM_CRITERIA_FILE)
-    st.info("🛠 Using custom criteria set from admin.")
-elif os.path.exists(DEFAULT_CRITERIA_FILE):
-    criteria_df = pd.read_csv(DEFAULT_CRITERIA_FILE)
-    st.info("📌 Using default criteria set.")
-else:
+criteria_df = storage.load_criteria(data_dir, use_custom)
+if criteria_df is None:
     st.error("❌ No criteria file found. Please upload `criteria_config.csv` or `custom_criteria.csv`. / ไม่พบไฟล์ โปรดอัปโหลด `criteria_config.csv` หรือ `custom_criteria.csv`")
     st.stop()
+elif storage.criteria_path(data_dir, use_custom).endswith(storage.CUSTOM_CRITERIA_FILE):
+    st.info("🛠 Using custom criteria set from admin.")
+else:
+    st.info("📌 Using default criteria set.")
 
 # Load data
-employee_df = pd.read_csv("employee_info.csv")
-eval_df = pd.read_csv("evaluation_data.csv")
+employee_df = storage.load_employees(data_dir)
 
 # Title
 st.title("📊 Employee Evaluation Dashboard")
 st.write("- Individual insights across competencies")
 st.caption("- สรุปผลการประเมินเชิงลึกของแต่ละพนักงาน")
 
-# Select year(s)
-available_years = sorted(eval_df["evaluation_year"].dropna().unique(), reverse=True)
+# Select year(s), archived years included
+available_years = storage.evaluation_years(data_dir)[::-1]
 
 if available_years:
     selected_years = st.multiselect(
@@ -51,8 +42,104 @@ else:
     st.warning("⚠️ No evaluation data available. Please fill the form first. / ยังไม่มีข้อมูลการประเมิน โปรดทำแบบประเมินก่อน")
     st.stop()
 
-# Filter by selected year
-eval_selected = eval_df[eval_df["evaluation_year"].isin(selected_years)]
+# Choose between one employee's full view and a side-by-side comparison
+MAX_COMPARE = 50
+view = st.radio("View / มุมมอง", ["Single employee / รายบุคคล", "Compare employees / เปรียบเทียบพนักงาน"], horizontal=True)
+
+if view == "Compare employees / เปรียบเทียบพนักงาน":
+    compare_department = st.selectbox("Select department / เลือกแผนก", ["All"] + sorted(employee_df["department"].dropna().unique()), key="compare_dept")
+    compare_pool = employee_df if compare_department == "All" else employee_df[employee_df["department"] == compare_department]
+    labels = (compare_pool["name"] + " (" + compare_pool["employee_id"] + ")").tolist()
+    label_of = dict(zip(compare_pool["employee_id"], labels))
+
+    whole_department = compare_department != "All" and st.checkbox("Compare the whole department / เปรียบเทียบทั้งแผนก")
+    if whole_department:
+        compare_ids = compare_pool["employee_id"].tolist()
+        if len(compare_ids) > MAX_COMPARE:
+            st.warning(f"Showing the first {MAX_COMPARE} of {len(compare_ids)} employees in {compare_department}. / แสดง {MAX_COMPARE} คนแรกจาก {len(compare_ids)} คนในแผนก {compare_department}")
+            compare_ids = compare_ids[:MAX_COMPARE]
+    else:
+        picked = st.multiselect(f"Select up to {MAX_COMPARE} employees / เลือกพนักงานได้สูงสุด {MAX_COMPARE} คน", labels, max_selections=MAX_COMPARE)
+        compare_ids = [label.split("(")[-1].replace(")", "").strip() for label in picked]
+
+    if len(compare_ids) < 2:
+        st.info("Select at least two employees to compare. / เลือกพนักงานอย่างน้อย 2 คนเพื่อเปรียบเทียบ")
+        st.stop()
+
+    # One groupby over the selected employees' rows of the summary table
+    comparison = aggregates.employee_comparison(data_dir, compare_ids, years=selected_years)
+    compare_scores = comparison["scores"]
+    if compare_scores.empty:
+        st.warning("No evaluations found for these employees in the selected year(s). / ไม่พบข้อมูลการประเมินของพนักงานเหล่านี้ในปีที่คุณเลือก")
+        st.stop()
+
+    rating_set = set(criteria_df.loc[criteria_df["type"] == "rating", "criteria"]) if use_custom else set(criteria_df["criteria"])
+    compare_criteria = [c for c in criteria_df["criteria"].unique() if c in rating_set and c in set(compare_scores["criteria"])]
+    compare_scores = compare_scores[compare_scores["criteria"].isin(compare_criteria)]
+    compare_scores = compare_scores.assign(employee=compare_scores["employee_id"].map(label_of))
+    compared = [label_of[i] for i in compare_ids if label_of[i] in set(compare_scores["employee"])]
+
+    st.write("___")
+
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    st.metric("👥 Employees compared / จำนวนพนักงานที่เปรียบเทียบ", len(compared))
+
+    # 1. Overlaid Radar Chart
+    st.subheader("🔹 Radar Chart")
+    st.caption("> แผนภูมิเรดาร์ซ้อนกัน")
+    matrix = compare_scores.pivot(index="criteria", columns="employee", values="score").reindex(index=compare_criteria, columns=compared)
+    fig = go.Figure()
+    for employee in compared:
+        fig.add_trace(go.Scatterpolar(
+            r=list(matrix[employee]) + [matrix[employee].iloc[0]],
+            theta=compare_criteria + compare_criteria[:1],
+            name=employee
+        ))
+    fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[1, 5])), height=550)
+    st.plotly_chart(fig, use_container_width=True)
+
+    # 2. Criteria x Employee Score Matrix
+    st.subheader("🔹 Score Matrix")
+    st.caption("> ตารางคะแนนตามเกณฑ์และพนักงาน")
+    fig = px.imshow(
+        matrix,
+        text_auto=".2f",
+        zmin=1,
+        zmax=5,
+        color_continuous_scale="blues",
+        aspect="auto",
+        labels={"x": "Employee", "y": "Criteria", "color": "Avg Score"},
+        height=max(400, 28 * len(compare_criteria))
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    # 3. Self vs Others Gaps
+    st.subheader("🔸 Self vs Others Gaps")
+    st.caption("> ส่วนต่างคะแนนตนเอง vs. ผู้อื่น (บวก = ประเมินตนเองสูงกว่า)")
+    gaps = compare_scores.pivot(index="criteria", columns="employee", values="gap").reindex(index=compare_criteria, columns=compared)
+    fig = px.imshow(
+        gaps,
+        text_auto=".2f",
+        zmin=-2,
+        zmax=2,
+        color_continuous_scale="RdBu_r",
+        aspect="auto",
+        labels={"x": "Employee", "y": "Criteria", "color": "Self - Others"},
+        height=max(400, 28 * len(compare_criteria))
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    summary = compare_scores.groupby("employee").agg(avg_score=("score", "mean"), avg_gap=("gap", "mean")).reindex(compared)
+    summary["evaluators"] = summary.index.map({label_of[i]: n for i, n in comparison["num_evaluators"].items()})
+    summary = summary.round(2).reset_index()
+    summary.columns = ["Employee", "Avg Score", "Avg Self - Others Gap", "Evaluators"]
+    summary.index = range(1, len(summary) + 1)
+    st.dataframe(summary, use_container_width=True)
+
+    render_export({"Scores": compare_scores, "Summary": summary}, "evaluation_comparison", key="compare_export")
+    st.stop()
 
 # Select department and employee
 departments = sorted(employee_df["department"].unique())
@@ -67,8 +154,8 @@ emp_row = filtered_employees[filtered_employees["name"] == employee_selected].il
 emp_id = emp_row["employee_id"]
 emp_dept = emp_row["department"]
 
-# Filter by selected employee
-emp_eval = eval_selected[eval_selected["employee_id"] == emp_id]
+# Only the selected employee's rows of the selected years are read (archived years only when selected)
+emp_eval = aggregates.employee_rows(data_dir, emp_id, selected_years)
 
 if emp_eval.empty:
     st.warning("No evaluations found for this employee in the selected year(s). / ไม่พบข้อมูลการประเมินของพนักงานคนนี้ในปีที่คุณเลือก")
@@ -98,6 +185,10 @@ caption_th = all_criteria_df.set_index("criteria")["caption_th"].to_dict()
 
 st.write("___")
 
+# Charts start here; plotly is imported only now so the selectors above paint first
+import plotly.express as px
+import plotly.graph_objects as go
+
 # 1. Number of Evaluators
 num_evaluators = emp_eval["evaluator_id"].nunique()
 st.metric("👥 Number of Evaluator / จำนวนคนประเมิน", num_evaluators)
@@ -212,17 +303,25 @@ st.plotly_chart(fig, use_container_width=True)
 st.subheader("📈 Trend Over Time")
 st.caption("> แนวโน้มรายปี")
 
-all_emp_eval = eval_df[eval_df["employee_id"] == emp_id]
-all_emp_eval = all_emp_eval[all_emp_eval["criteria"].isin(rating_criteria)]
-criteria_options = all_emp_eval["criteria"].unique()
+# Yearly means and deltas come from the precomputed year-over-year table
+employee_yoy, _ = trends.load(data_dir)
+emp_yoy = employee_yoy[(employee_yoy["employee_id"] == emp_id) & (employee_yoy["criteria"].isin(rating_criteria))]
+criteria_options = emp_yoy["criteria"].unique()
 
 if len(criteria_options) > 0:
     selected_criterion = st.selectbox("Select a criterion to view trend / เลือกเกณฑ์ต้องการจะดู", criteria_options)
 
-    trend = all_emp_eval[all_emp_eval["criteria"] == selected_criterion]
-    trend = trend.groupby("evaluation_year")["score"].mean().reset_index()
+    trend = emp_yoy[emp_yoy["criteria"] == selected_criterion]
+    trend = trend[["evaluation_year", "score_mean", "delta"]].rename(columns={"score_mean": "score"})
     trend["evaluation_year"] = trend["evaluation_year"].astype(str)
 
+    latest = trend.iloc[-1]
+    st.metric(
+        f"Latest Avg Score ({latest['evaluation_year']}) / คะแนนเฉลี่ยล่าสุด",
+        f"{latest['score']:.2f}",
+        delta=None if pd.isna(latest["delta"]) else f"{latest['delta']:+.2f} vs previous year"
+    )
+
     fig = px.line(
         trend,
         x="evaluation_year",
@@ -249,6 +348,8 @@ table["Avg Score"] = table["Avg Score"].round(2)
 table.index = range(1, len(table) + 1)
 st.dataframe(table, use_container_width=True)
 
+render_export({"Rows": emp_eval, "Summary": avg_scores}, f"evaluation_{emp_id}", key="employee_export")
+
 # 8. Progress Towards Goals (custom only)
 if use_custom:
     numeric_criteria = [c for c, t in type_map.items() if t == "numeric"]
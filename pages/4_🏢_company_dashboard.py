@@ -1,102 +1,80 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import datetime
 import os
-import json
-import numpy as np
+from utils import aggregates, api, coverage, sketches, storage, tenants, trends
+from utils.export import render_export
 
-# Configuration
-CONFIG_FILE = "config.json"
-DEFAULT_CRITERIA_FILE = "criteria_config.csv"
-CUSTOM_CRITERIA_FILE = "custom_criteria.csv"
-EMPLOYEE_INFO_FILE = "employee_info.csv"
+api.serve_in_background()
 
 # Load configuration
-config = {"use_custom": False}
-if os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-        config = json.load(f)
+data_dir = tenants.current_data_dir()
+config = storage.load_config(data_dir)
 
 use_custom = config.get("use_custom", False)
 
 # Load criteria file based on config
-if use_custom and os.path.exists(CUSTOM_CRITERIA_FILE):
-    criteria_df = pd.read_csv(CUSTOM_CRITERIA_FILE)
-    st.info("🛠 Using custom criteria set from admin.")
-elif os.path.exists(DEFAULT_CRITERIA_FILE):
-    criteria_df = pd.read_csv(DEFAULT_CRITERIA_FILE)
-    st.info("📌 Using default criteria set.")
-else:
+criteria_df = storage.load_criteria(data_dir, use_custom)
+if criteria_df is None:
     st.error("❌ No criteria file found. Please upload `criteria_config.csv` or `custom_criteria.csv`. / ไม่พบไฟล์ โปรดอัปโหลด `criteria_config.csv` หรือ `custom_criteria.csv`")
     st.stop()
-
-# Filling defaults if missing
-if 'type' not in criteria_df.columns:
-    criteria_df['type'] = 'rating' # Default to 'rating'
-if 'target_value' not in criteria_df.columns:
-    criteria_df['target_value'] = np.nan 
+elif storage.criteria_path(data_dir, use_custom).endswith(storage.CUSTOM_CRITERIA_FILE):
+    st.info("🛠 Using custom criteria set from admin.")
+else:
+    st.info("📌 Using default criteria set.")
 
 # Load other data files
-if os.path.exists(EMPLOYEE_INFO_FILE):
-    employee_df = pd.read_csv(EMPLOYEE_INFO_FILE)
-else:
-    st.error(f"❌ Missing {EMPLOYEE_INFO_FILE}. Please upload it. / ไม่พบไฟล์ {EMPLOYEE_INFO_FILE} โปรดอัปโหลด")
+if not os.path.exists(storage.path(data_dir, storage.EMPLOYEE_FILE)):
+    st.error(f"❌ Missing {storage.EMPLOYEE_FILE}. Please upload it. / ไม่พบไฟล์ {storage.EMPLOYEE_FILE} โปรดอัปโหลด")
     st.stop()
+employee_df = storage.load_employees(data_dir)
 
-if os.path.exists("evaluation_data.csv"):
-    eval_df = pd.read_csv("evaluation_data.csv")
-else:
+if not storage.evaluations_exist(data_dir):
     st.error("❌ Missing evaluation_data.csv. Please upload it. / ไม่พบไฟล์ evaluation_data.csv โปรดอัปโหลด")
     st.stop()
-
-eval_df['evaluation_year'] = eval_df['evaluation_year'].astype(int)
-# Clean up whitespace and lower-case
-eval_df["criteria"] = eval_df["criteria"].astype(str).str.strip()
-eval_df["type"] = eval_df["type"].astype(str).str.strip().str.lower()
-criteria_df["criteria"] = criteria_df["criteria"].astype(str).str.strip()
-criteria_df["type"] = criteria_df["type"].astype(str).str.strip().str.lower()
-
-# Merge eval_df with employee_df to get department information
-merged_eval_df = pd.merge(eval_df, employee_df[['employee_id', 'department']], on='employee_id', how='left')
+# Loaded tables follow utils/schema.py (typed, trimmed, lower-cased types), so no cleaning is needed here.
+# Each evaluation row also carries the department the employee was in when it was written.
+# They are shared through the cache, so never modify them in place.
+# Sections load only the data they show, and import plotly only when they draw a chart.
 
 # Sidebar navigation
 st.sidebar.title("Navigation")
-section = st.sidebar.radio("Go to", ["Criteria Dashboard", "Department Focus", "Trend Over Time", "Progress Towards Goals", "Text Responses"])
+section = st.sidebar.radio("Go to", ["Criteria Dashboard", "Department Focus", "Trend Over Time", "Biggest Movers", "Progress Towards Goals", "Text Responses", "Score Distribution", "Department Heatmap", "Evaluation Coverage"])
 
 # Caption mapping
 caption_eng = criteria_df.set_index("criteria")["caption_eng"].to_dict()
 caption_th = criteria_df.set_index("criteria")["caption_th"].to_dict()
 
-# Create target_map from criteria_df
-target_map = criteria_df.set_index("criteria")["target_value"].to_dict()
-
 # --- Dashboard ---
 # 1. Criteria Dashboard
 if section == "Criteria Dashboard":
     st.subheader("📊 Criteria Dashboard (Company-Wide)")
     st.caption("> สรุปค่าเฉลี่ยตามเกณฑ์การประเมินทั่วทั้งบริษัท")
 
-    # Filter for 'rating' criteria
+    # Filter for 'rating' criteria in the cached per-(year, criterion) averages
     rating_criteria_for_dashboard = criteria_df[criteria_df["type"] == "rating"]["criteria"].unique()
-    eval_df_for_dashboard = eval_df[eval_df["criteria"].isin(rating_criteria_for_dashboard)]
+    criteria_averages = aggregates.criteria_averages(data_dir)
+    criteria_averages = criteria_averages[criteria_averages["criteria"].isin(rating_criteria_for_dashboard)]
 
-    available_years = sorted(eval_df_for_dashboard["evaluation_year"].dropna().unique(), reverse=True)
+    available_years = sorted(criteria_averages["evaluation_year"].unique(), reverse=True)
     selected_year = st.selectbox("Select Evaluation Year / เลือกปีที่ประเมิน", available_years)
 
     criteria_groups = sorted(criteria_df["department"].unique())
     selected_group = st.selectbox("Select Criteria Group / เลือกกลุ่มเกณฑ์การประเมิน", criteria_groups)
 
-    filtered_eval = eval_df_for_dashboard[(eval_df_for_dashboard["evaluation_year"] == selected_year)]
     group_criteria = criteria_df[criteria_df["department"] == selected_group]["criteria"].unique()
-    filtered_eval = filtered_eval[filtered_eval["criteria"].isin(group_criteria)]
-
-    criteria_avg = filtered_eval.groupby('criteria')['score'].mean().reset_index()
+    criteria_avg = criteria_averages[
+        (criteria_averages["evaluation_year"] == selected_year) &
+        (criteria_averages["criteria"].isin(group_criteria))
+    ][["criteria", "score"]]
     criteria_avg["score"] = criteria_avg["score"].round(2)
     criteria_avg = criteria_avg.sort_values(by="score", ascending=True)
 
     if criteria_avg.empty:
         st.warning("No data available for the selected group and year. / ไม่พบข้อมูลสำหรับแผนกและปีที่เลือก")
     else:
+        import plotly.express as px
+
         bar_fig = px.bar(
             criteria_avg,
             x='score',
@@ -109,14 +87,21 @@ if section == "Criteria Dashboard":
             height=500
         )
         st.plotly_chart(bar_fig, use_container_width=True)
+        render_export({
+            "Rows": lambda: (lambda rows: rows[rows["criteria"].isin(group_criteria)])(
+                storage.load_evaluations(data_dir, years=[selected_year])),
+            "Summary": criteria_avg
+        }, f"criteria_{selected_year}", key="criteria_export")
 
 # 2. Department Focus
 elif section == "Department Focus":
     st.title("🏢 Department Focus")
     st.caption("> สรุปค่าเฉลี่ยผลการประเมินของแต่ละแผนกในแต่ละปีที่เลือก/ เปรียบเทียบรายปี")
-    departments = sorted(employee_df["department"].unique())
+    # Include departments that only appear in past evaluations (e.g. since renamed or closed)
+    past_departments = aggregates.group_scores(data_dir)["department"].dropna().unique()
+    departments = sorted(set(employee_df["department"].dropna()) | set(past_departments))
     selected_department = st.selectbox("Select Department/ เลือกแผนก", departments)
-    available_years = sorted(eval_df["evaluation_year"].unique(), reverse=True)
+    available_years = storage.evaluation_years(data_dir)[::-1]
     selected_years = st.multiselect("Select Evaluation Year(s)/ เลือกปีที่ประเมิน (สามารถเลือกได้มากกว่า 1 ปี)", available_years, default=available_years[:1])
 
     if not selected_years:
@@ -124,14 +109,14 @@ elif section == "Department Focus":
     else:
         # Filter for 'rating' criteria
         rating_criteria_for_dept = criteria_df[criteria_df["type"] == "rating"]["criteria"].unique()
-        dept_data = merged_eval_df[(merged_eval_df["department"] == selected_department) &
-                                   (merged_eval_df["evaluation_year"].isin(selected_years)) &
-                                   (merged_eval_df["criteria"].isin(rating_criteria_for_dept))]
+        # Aggregated in worker processes straight from the files once the data is large
+        avg_scores = aggregates.department_scores(data_dir, selected_department, selected_years, rating_criteria_for_dept)
 
-        if dept_data.empty:
+        if avg_scores.empty:
             st.warning("No evaluation data for selected department and years./ ไม่พบข้อมูลสำหรับแผนกและปีที่เลือก")
         else:
-            avg_scores = dept_data.groupby(["evaluation_year", "criteria"])["score"].mean().reset_index()
+            import plotly.express as px
+
             avg_scores["score"] = avg_scores["score"].round(2)
 
             fig = px.line(
@@ -140,6 +125,12 @@ elif section == "Department Focus":
                 labels={"score": "Average Score", "caption": "Criteria"}
             )
             st.plotly_chart(fig, use_container_width=True)
+            render_export({
+                "Rows": lambda: (lambda rows: rows[(rows["department"] == selected_department) &
+                                                   (rows["criteria"].isin(rating_criteria_for_dept))])(
+                    storage.load_evaluations(data_dir, years=selected_years)),
+                "Summary": avg_scores
+            }, "department_focus", key="department_export")
 
 # 3. Trend over time
 elif section == "Trend Over Time":
@@ -152,10 +143,12 @@ elif section == "Trend Over Time":
     selected_criteria = st.multiselect("Select Criteria/ เลือกเกณฑ์การประเมิน", available_criteria, default=available_criteria[:3])
 
     if selected_criteria:
-        trend_data = eval_df[eval_df["criteria"].isin(selected_criteria)]
-        trend_summary = trend_data.groupby(["evaluation_year", "criteria"])["score"].mean().reset_index()
-        trend_summary["score"] = trend_summary["score"].round(2)
-        #trend_summary["caption"] = trend_summary["criteria"].map(caption_eng)
+        import plotly.express as px
+
+        # Yearly means come from the precomputed year-over-year table
+        _, department_yoy = trends.load(data_dir)
+        trend_summary = trends.yearly_means(department_yoy, selected_criteria)
+        trend_summary = trend_summary[["evaluation_year", "criteria", "score", "delta", "trend"]].round(2)
 
         fig = px.line(
             trend_summary,
@@ -168,10 +161,52 @@ elif section == "Trend Over Time":
         )
         fig.update_layout(xaxis=dict(dtick=1))
         st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("**Year-over-Year Change / การเปลี่ยนแปลงเทียบกับปีก่อน**")
+        st.dataframe(trend_summary.dropna(subset=["delta"]).reset_index(drop=True), use_container_width=True)
+        render_export({
+            "Rows": lambda: (lambda rows: rows[rows["criteria"].isin(selected_criteria)])(
+                storage.load_evaluations(data_dir, years=storage.evaluation_years(data_dir))),
+            "Summary": trend_summary
+        }, "trend", key="trend_export")
     else:
         st.info("Please select at least one criterion. / โปรดเลือกเกณฑ์อย่างน้อย 1 ข้อ")
 
-# 4. Progress towards goals
+# 4. Biggest movers
+elif section == "Biggest Movers":
+    st.subheader("🚀 Biggest Movers")
+    st.caption("> พนักงานที่มีคะแนนเปลี่ยนแปลงมากที่สุดเมื่อเทียบกับปีก่อน")
+
+    employee_yoy, _ = trends.load(data_dir)
+    rating_criteria_for_movers = criteria_df[criteria_df["type"] == "rating"]["criteria"].unique()
+    mover_years = sorted(employee_yoy.loc[employee_yoy["delta"].notna(), "evaluation_year"].unique(), reverse=True)
+
+    if not mover_years:
+        st.info("At least two years of evaluations are needed to compare. / ต้องมีข้อมูลการประเมินอย่างน้อย 2 ปีจึงจะเปรียบเทียบได้")
+    else:
+        selected_mover_year = st.selectbox("Select Evaluation Year / เลือกปีที่ประเมิน", mover_years)
+        top_n = st.slider("Number of employees / จำนวนพนักงาน", 3, 25, 10)
+
+        improving, declining = trends.biggest_movers(employee_yoy, selected_mover_year, rating_criteria_for_movers, top_n)
+        names = employee_df.drop_duplicates("employee_id").set_index("employee_id")
+        mover_columns = {
+            "employee_id": "Employee ID", "name": "Name", "department": "Department",
+            "avg_delta": "Avg Change", "criteria_improved": "Criteria Improved", "criteria_declined": "Criteria Declined"
+        }
+
+        col1, col2 = st.columns(2)
+        for col, title, movers in [(col1, "📈 Top Improving / พัฒนาขึ้นมากที่สุด", improving),
+                                   (col2, "📉 Top Declining / ลดลงมากที่สุด", declining)]:
+            with col:
+                st.markdown(f"**{title}**")
+                if movers.empty:
+                    st.info("No employees in this group. / ไม่มีพนักงานในกลุ่มนี้")
+                else:
+                    movers = movers.join(names[["name", "department"]], on="employee_id")
+                    movers["avg_delta"] = movers["avg_delta"].round(2)
+                    st.dataframe(movers[list(mover_columns)].rename(columns=mover_columns), hide_index=True, use_container_width=True)
+
+# 5. Progress towards goals
 elif section == "Progress Towards Goals":
     st.subheader("🎯 Progress Towards Goals")
     st.caption("> ความคืบหน้าสู่เป้าหมาย")
@@ -184,22 +219,26 @@ elif section == "Progress Towards Goals":
         st.warning("No criteria of type 'numeric' found in the loaded criteria configuration. / ไม่พบเกณฑ์ประเภท 'ตัวเลข'")
         st.stop()
 
-    available_years = sorted(merged_eval_df["evaluation_year"].dropna().unique(), reverse=True)
+    available_years = storage.evaluation_years(data_dir)[::-1]
     selected_years_num = st.multiselect("Select Evaluation Year(s)/ เลือกปีที่ประเมิน (สามารถเลือกได้มากกว่า 1 ปี)", available_years, default=available_years)
 
-    available_departments = sorted(merged_eval_df["department"].dropna().unique())
+    available_departments = sorted(aggregates.goal_values(data_dir)["department"].dropna().unique())
     selected_departments_num = st.multiselect("Select Department(s)/ เลือกแผนก", available_departments, default=available_departments)
 
-    # Filter based on selected criteria, years, and departments
-    filtered_numeric_data = merged_eval_df[
-        (merged_eval_df["criteria"].isin(numeric_criteria_list)) &
-        (merged_eval_df["evaluation_year"].isin(selected_years_num)) &
-        (merged_eval_df["department"].isin(selected_departments_num))
-    ].copy()
+    # Sums and counts of numeric answers per (year, criterion) for the selected years and departments
+    goal_summary = aggregates.goal_progress(data_dir, years=selected_years_num, departments=selected_departments_num)
 
-    if filtered_numeric_data.empty:
+    if goal_summary.empty:
         st.info("No numeric data available for the selected filters. / ไม่พบข้อมูล")
     else:
+        render_export({
+            "Rows": lambda: (lambda rows: rows[
+                (rows["criteria"].isin(numeric_criteria_list)) &
+                (rows["department"].isin(selected_departments_num))
+            ])(storage.load_evaluations(data_dir, years=selected_years_num)),
+            "Summary": goal_summary
+        }, "goal_progress", key="goals_export")
+
         view_by_year = st.toggle("Display by Year/ แสดงผลแยกตามปี", value=True)
 
         for crit in numeric_criteria_list:
@@ -222,38 +261,30 @@ elif section == "Progress Towards Goals":
                 st.warning(f"Target value is zero. Cannot calculate progress. ไม่สามารถคำนวณความคืบหน้าได้ เนื่องจากค่าเป้าหมายมีค่าเป็นศูนย์")
                 continue
 
+            crit_summary = goal_summary[goal_summary["criteria"] == crit]
+
             if view_by_year:
                 # View by year
-                years_in_data = sorted(filtered_numeric_data[filtered_numeric_data["criteria"] == crit]["evaluation_year"].unique())
-                if not years_in_data:
+                if crit_summary.empty:
                     st.info(f"No data in selected years/departments. / ไม่พบข้อมูลในปีและแผนกที่คุณเลือก")
                     continue
 
-                for year in years_in_data:
-                    year_data = filtered_numeric_data[
-                        (filtered_numeric_data["criteria"] == crit) &
-                        (filtered_numeric_data["evaluation_year"] == year)
-                    ]
-                    values = year_data["value"].dropna().astype(float)
-                    
-                    if not values.empty:
-                        avg_val = values.mean()
-                        progress_ratio = min(avg_val / target, 1.0) # Cap at 100%
-                        st.progress(progress_ratio, text=f"**{year}**: {avg_val:.2f} / {target:.2f} ({progress_ratio:.0%})")
-                    else:
-                        st.info(f"No data in {year} with selected filters. / ไม่พบข้อมูลของปี {year}")
+                for _, year_row in crit_summary.sort_values("evaluation_year").iterrows():
+                    year = year_row["evaluation_year"]
+                    avg_val = year_row["average"]
+                    progress_ratio = min(avg_val / target, 1.0) # Cap at 100%
+                    st.progress(progress_ratio, text=f"**{year}**: {avg_val:.2f} / {target:.2f} ({progress_ratio:.0%})")
             else:
                 # Aggregate view (all selected years and departments)
-                values = filtered_numeric_data[filtered_numeric_data["criteria"] == crit]["value"].dropna().astype(float)
-                if not values.empty:
-                    avg_val = values.mean()
+                if not crit_summary.empty:
+                    avg_val = crit_summary["value_sum"].sum() / crit_summary["value_count"].sum()
                     progress_ratio = min(avg_val / target, 1.0) # Cap at 100%
                     st.progress(progress_ratio, text=f"**Overall Average**: {avg_val:.2f} / {target:.2f} ({progress_ratio:.0%})")
                 else:
                     st.info(f"No overall data with selected filters. / ไม่พบข้อมูลโดยรวมสำหรับตัวกรองที่เลือก")
 
 
-# 5. Text responses
+# 6. Text responses
 elif section == "Text Responses":
     st.subheader("💬 Text Responses by Year and Criteria")
     st.caption("> ความคิดเห็นจากผู้ประเมิน")
@@ -266,7 +297,8 @@ elif section == "Text Responses":
         st.stop()
 
     # Get all available years
-    available_text_years = sorted(eval_df[eval_df["criteria"].isin(text_criteria_list)]["evaluation_year"].dropna().unique(), reverse=True)
+    # Rows are only read once a year is selected
+    available_text_years = storage.evaluation_years(data_dir)[::-1]
 
     if not available_text_years:
         st.info("No text response data available. / ไม่พบข้อมูลการตอบกลับที่เป็นข้อความ")
@@ -275,14 +307,14 @@ elif section == "Text Responses":
         selected_text_year = st.selectbox("Select Evaluation Year/ เลือกปีที่ประเมิน", available_text_years)
 
         # Filter by selected year
-        year_text_data = eval_df[
-            (eval_df["evaluation_year"] == selected_text_year) & 
-            (eval_df["criteria"].isin(text_criteria_list))
-        ].copy()
+        year_text_data = storage.load_evaluations(data_dir, years=[selected_text_year])
+        year_text_data = year_text_data[year_text_data["criteria"].isin(text_criteria_list)]
 
         if year_text_data.empty:
             st.info(f"No text responses for {selected_text_year}. / ไม่พบข้อมูลสำหรับปี {selected_text_year}")
         else:
+            render_export({"Rows": year_text_data}, f"text_responses_{selected_text_year}", key="text_export")
+
             # Group by criteria and display responses in expanders
             for crit in sorted(text_criteria_list):
                 criteria_display_name = caption_eng.get(crit, crit)
@@ -297,4 +329,139 @@ elif section == "Text Responses":
                             if pd.notna(row['text_response']):
                                 st.markdown(f"- {row['text_response']}")
                             else:
-                                st.markdown("- *No response provided.* / ยังไม่มีความคิดเห็นสำหรับรายการนี้")
\ No newline at end of file
+                                st.markdown("- *No response provided.* / ยังไม่มีความคิดเห็นสำหรับรายการนี้")
+
+# 7. Score distribution
+elif section == "Score Distribution":
+    st.subheader("📦 Score Distribution")
+    st.caption("> การกระจายของคะแนน: ค่ามัธยฐาน ควอไทล์ และเปอร์เซ็นไทล์ที่ 90")
+
+    field_labels = {"Ratings / คะแนน": "score", "Numeric answers / คำตอบเชิงตัวเลข": "value"}
+    field = field_labels[st.radio("Answers / ประเภทคำตอบ", list(field_labels), horizontal=True)]
+    field_type = "rating" if field == "score" else "numeric"
+    field_criteria = sorted(criteria_df[criteria_df["type"] == field_type]["criteria"].unique())
+
+    # Quantiles come from per-(year, department, criterion) sketches merged for the selection
+    sketch_table = sketches.load(data_dir)
+    available_years = storage.evaluation_years(data_dir)[::-1]
+    selected_years = st.multiselect("Select Evaluation Year(s)/ เลือกปีที่ประเมิน (สามารถเลือกได้มากกว่า 1 ปี)", available_years, default=available_years[:1])
+    available_departments = sorted(sketch_table["department"].dropna().unique())
+    selected_departments = st.multiselect("Select Department(s)/ เลือกแผนก", available_departments, default=available_departments)
+    selected_criteria = st.multiselect("Select Criteria/ เลือกเกณฑ์การประเมิน", field_criteria, default=field_criteria[:8])
+    by_year = st.toggle("Compare years / เปรียบเทียบรายปี", value=False)
+
+    keys = ["criteria", "evaluation_year"] if by_year else ["criteria"]
+    distribution = sketches.quantiles(sketch_table, field, keys, years=selected_years,
+                                      departments=selected_departments, criteria=selected_criteria)
+
+    if distribution.empty:
+        st.info("No data available for the selected filters. / ไม่พบข้อมูล")
+    else:
+        import plotly.graph_objects as go
+
+        fig = go.Figure()
+        groups = distribution.groupby("evaluation_year") if by_year else [("All selected years", distribution)]
+        for name, group in groups:
+            fig.add_trace(go.Box(
+                x=group["criteria"], name=str(name),
+                lowerfence=group["min"], q1=group["q1"], median=group["median"],
+                q3=group["q3"], upperfence=group["max"],
+            ))
+        fig.update_layout(boxmode="group", title="Distribution by Criteria (min, quartiles, max)",
+                          yaxis_title="Score" if field == "score" else "Value")
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("**Median and P90 / ค่ามัธยฐานและเปอร์เซ็นไทล์ที่ 90**")
+        st.dataframe(distribution[keys + ["median", "p90", "count"]].round(2), hide_index=True, use_container_width=True)
+        render_export({"Summary": distribution}, f"distribution_{field}", key="distribution_export")
+
+# 8. Department heatmap
+elif section == "Department Heatmap":
+    st.subheader("🗺️ Department Heatmap")
+    st.caption("> คะแนนเฉลี่ยของทุกแผนกในทุกเกณฑ์การประเมิน")
+
+    rating_criteria_for_heatmap = criteria_df[criteria_df["type"] == "rating"]["criteria"].unique().tolist()
+    available_years = storage.evaluation_years(data_dir)[::-1]
+    selected_years = st.multiselect("Select Evaluation Year(s)/ เลือกปีที่ประเมิน (สามารถเลือกได้มากกว่า 1 ปี)", available_years, default=available_years[:1])
+    by_evaluator_type = st.toggle("Split by evaluator type / แยกตามประเภทผู้ประเมิน", value=False)
+
+    # Every department x criterion mean in one pivot of the cached summary table
+    heatmap = aggregates.score_heatmap(data_dir, selected_years, rating_criteria_for_heatmap, by_evaluator_type)
+
+    if heatmap.empty:
+        st.info("No data available for the selected years. / ไม่พบข้อมูล")
+    else:
+        import plotly.express as px
+
+        labels = [" · ".join(map(str, idx)) if by_evaluator_type else str(idx) for idx in heatmap.index]
+        fig = px.imshow(
+            heatmap.to_numpy(), x=list(heatmap.columns), y=labels,
+            color_continuous_scale="RdYlGn", zmin=1, zmax=5, aspect="auto", text_auto=".2f",
+            labels={"x": "Criteria", "y": "Department", "color": "Avg Score"},
+            title="Average Score by Department and Criteria",
+            height=max(400, 40 * len(labels) + 150)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("**Weakest and strongest per criterion / ต่ำสุดและสูงสุดในแต่ละเกณฑ์**")
+        scored = heatmap.dropna(axis=1, how="all")
+        extremes = pd.DataFrame({
+            "Weakest": scored.idxmin().map(lambda idx: " · ".join(idx) if by_evaluator_type else idx),
+            "Lowest": scored.min().round(2),
+            "Strongest": scored.idxmax().map(lambda idx: " · ".join(idx) if by_evaluator_type else idx),
+            "Highest": scored.max().round(2),
+        })
+        st.dataframe(extremes, use_container_width=True)
+        render_export({"Summary": heatmap.round(2).reset_index()}, "department_heatmap", key="heatmap_export")
+
+# 9. Evaluation coverage
+elif section == "Evaluation Coverage":
+    st.subheader("✅ Evaluation Coverage")
+    st.caption("> ความครบถ้วนของการประเมิน: พนักงานแต่ละคนได้รับการประเมินจากผู้ประเมินแต่ละประเภทแล้วหรือยัง")
+
+    # Years come from the coverage table too, so a rerun after a submit does not reload the evaluations.
+    # The current review year (set on the Admin page, else this year) is offered before anyone has submitted for it.
+    coverage_table = coverage.load(data_dir)
+    review_year = int(config.get("evaluation_year", datetime.date.today().year))
+    available_years = sorted(set(coverage_table["evaluation_year"].unique().tolist()) | {review_year}, reverse=True)
+    selected_year = st.selectbox("Select Evaluation Year / เลือกปีที่ประเมิน", available_years)
+    type_options = coverage.EVALUATOR_TYPES + sorted(set(coverage_table["evaluator_type"].dropna().unique()) - set(coverage.EVALUATOR_TYPES))
+    required_types = st.multiselect("Expected evaluator types / ประเภทผู้ประเมินที่ต้องมี", type_options, default=coverage.EVALUATOR_TYPES)
+
+    # Current employees x expected evaluator types, anti-joined against the submitted combinations
+    completion, missing = coverage.report(employee_df, coverage_table, selected_year, required_types)
+
+    if completion.empty or not required_types:
+        st.info("No employees or evaluator types selected. / ไม่พบข้อมูล")
+    else:
+        import plotly.express as px
+
+        expected = int(completion["expected"].sum())
+        completed = int(completion["completed"].sum())
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Completion / ความครบถ้วน", f"{completed / expected:.1%}")
+        col2.metric("Completed / ประเมินแล้ว", f"{completed:,}")
+        col3.metric("Missing / ยังไม่ได้ประเมิน", f"{expected - completed:,}")
+
+        fig = px.bar(
+            completion.sort_values("completion_rate"), x="completion_rate", y="department", orientation="h",
+            range_x=[0, 1], text_auto=".0%", labels={"completion_rate": "Completion", "department": "Department"},
+            title=f"Completion by Department ({selected_year})",
+            height=max(400, 30 * len(completion) + 150)
+        )
+        fig.update_xaxes(tickformat=".0%")
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("**Completion by department and evaluator type / ความครบถ้วนตามแผนกและประเภทผู้ประเมิน**")
+        percent_columns = ["completion_rate"] + required_types
+        st.dataframe(completion.style.format({col: "{:.0%}" for col in percent_columns}), hide_index=True, use_container_width=True)
+
+        st.markdown("**Missing evaluations / การประเมินที่ยังขาด**")
+        departments = sorted(completion["department"])
+        selected_departments = st.multiselect("Select Department(s)/ เลือกแผนก", departments, default=departments)
+        missing = missing[missing["department"].isin(selected_departments)]
+        shown = 1000
+        st.dataframe(missing.head(shown), hide_index=True, use_container_width=True)
+        if len(missing) > shown:
+            st.caption(f"Showing {shown:,} of {len(missing):,} missing evaluations; export for the full list. / แสดง {shown:,} จาก {len(missing):,} รายการ")
+        render_export({"Completion": completion, "Missing": missing}, f"coverage_{selected_year}", key="coverage_export")
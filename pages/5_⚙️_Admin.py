@@ -1,43 +1,40 @@
+import datetime
+
 import streamlit as st
-import pandas as pd
-import json
-import os
+from utils import archive, schema, storage, tenants, tombstones
 
 st.header("🛠️ Admin Panel: Customize Evaluation Form")
 st.caption("> ระบบแอดมิน: ปรับแต่งแบบประเมิน")
 
-CONFIG_FILE = "config.json"
-CUSTOM_CRITERIA_FILE = "custom_criteria.csv"
-
 DEPARTMENTS = ["Core", "Finance/Accounting", "HR", "IT", "Marketing", "Sales", "Operations"]
 QUESTION_TYPES = ["rating", "numeric", "text"]
 
 # Load or initialize config
-def load_config():
-    if not os.path.exists(CONFIG_FILE):
-        default_config = {"use_custom": False}
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(default_config, f)
-    with open(CONFIG_FILE, "r") as f:
-        return json.load(f)
-
-def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f)
-
-config = load_config()
+data_dir = tenants.current_data_dir()
+config = storage.load_config(data_dir)
 
 # Toggle custom
 use_custom = st.checkbox("Click if you want to custom evaluation form/ คลิกเมื่อต้องการใช้แบบประเมินที่ปรับแต่งเอง", value=config.get("use_custom", False))
 config["use_custom"] = use_custom
-save_config(config)
+
+# Current review year, offered by Evaluation Coverage before anyone has submitted for it
+this_year = datetime.date.today().year
+review_year = int(st.number_input("Current review year / ปีที่กำลังประเมิน", value=int(config.get("evaluation_year", this_year)),
+                                  step=1, help="Defaults to this calendar year. / ค่าเริ่มต้นคือปีปัจจุบัน"))
+if review_year == this_year:
+    # Not stored, so the default moves on with the calendar
+    config.pop("evaluation_year", None)
+else:
+    config["evaluation_year"] = review_year
+storage.save_config(data_dir, config)
 
 st.markdown("---")
 
 # Show default criteria
 with st.expander("📋 View Default Evaluation Criteria / ดูเกณฑ์ประเมินเริ่มต้น"):
-    if os.path.exists("criteria_config.csv"):
-        default_df = pd.read_csv("criteria_config.csv")
+    default_criteria_file = storage.criteria_path(data_dir, use_custom=False)
+    if default_criteria_file is not None:
+        default_df = storage.load_criteria(data_dir, use_custom=False)
         
         # Dropdown for department selection
         selected_dept = st.selectbox("Select department to view / เลือกแผนก", ["All"] + DEPARTMENTS)
@@ -60,15 +57,9 @@ if use_custom:
     st.caption("> ปรับแต่งแบบประเมิน สามารถเพิ่มหรือลบคำถามได้")
     st.info("> หมายเหตุ: เมื่อเลือกคำถามเชิงตัวเลข (numeric) สามารถใส่ target หรือค่าเป้าหมายได้")
 
-    if os.path.exists(CUSTOM_CRITERIA_FILE):
-        custom_df = pd.read_csv(CUSTOM_CRITERIA_FILE)
-    else:
-        custom_df = pd.DataFrame(columns=["department", "criteria", "caption_eng", "caption_th", "type"])
-
-    if "type" not in custom_df.columns:
-        custom_df["type"] = "rating"
-    else:
-        custom_df["type"] = custom_df["type"].fillna("rating")
+    custom_df = storage.load_custom_criteria(data_dir)
+    if custom_df is None:
+        custom_df = storage.empty_table(schema.CRITERIA_SCHEMA)
 
     edited_df = st.data_editor(
         custom_df,
@@ -95,5 +86,47 @@ if use_custom:
     )
 
     if st.button("💾 Save Custom Criteria/ บันทึกแบบประเมิน"):
-        edited_df.to_csv(CUSTOM_CRITERIA_FILE, index=False)
-        st.success("✅ Custom criteria saved/ บันทึกสำเร็จ")
+        try:
+            storage.save_custom_criteria(data_dir, edited_df)
+            st.success("✅ Custom criteria saved/ บันทึกสำเร็จ")
+        except ValueError as e:
+            st.error(f"❌ Could not save criteria: {e} / ไม่สามารถบันทึกแบบประเมินได้")
+
+st.markdown("---")
+
+# Archive closed years
+with st.expander("🗄️ Archive closed years / จัดเก็บข้อมูลปีที่ปิดแล้ว"):
+    st.caption("> Archived years stay in the dashboards but no longer accept new evaluations. / ปีที่จัดเก็บแล้วยังแสดงในแดชบอร์ด แต่ไม่สามารถเพิ่มผลการประเมินได้")
+    archived = archive.archived_years(data_dir)
+    closed_years = [y for y in storage.evaluation_years(data_dir)
+                    if y < datetime.date.today().year and y not in archived]
+
+    years_to_archive = st.multiselect("Years to archive / เลือกปีที่ต้องการจัดเก็บ", closed_years)
+    if st.button("🗄️ Archive / จัดเก็บ", disabled=not years_to_archive):
+        try:
+            moved = archive.archive_years(data_dir, years_to_archive)
+            st.success(f"✅ Archived {moved:,} rows / จัดเก็บ {moved:,} แถว")
+        except ValueError as e:
+            st.error(f"❌ Could not archive: {e} / ไม่สามารถจัดเก็บได้")
+
+    if archived:
+        st.write("Archived years / ปีที่จัดเก็บแล้ว: " + ", ".join(str(y) for y in archived))
+        years_to_restore = st.multiselect("Years to restore / เลือกปีที่ต้องการนำกลับ", archived)
+        if st.button("♻️ Restore / นำกลับ", disabled=not years_to_restore):
+            moved = archive.restore_years(data_dir, years_to_restore)
+            st.success(f"✅ Restored {moved:,} rows / นำกลับ {moved:,} แถว")
+
+# Compaction of deleted employees
+compaction_error = tombstones.compaction_error(data_dir)
+if compaction_error:
+    st.error(f"❌ Removing deleted employees' rows failed / การลบข้อมูลของพนักงานที่ถูกลบล้มเหลว: {compaction_error}")
+with st.expander("🧹 Deleted employees' data / ข้อมูลของพนักงานที่ถูกลบ"):
+    st.caption("> Deleted employees are hidden right away; their rows are removed from the data files in the background. / พนักงานที่ถูกลบจะถูกซ่อนทันที และข้อมูลจะถูกลบออกจากไฟล์ในเบื้องหลัง")
+    pending = tombstones.pending(data_dir)
+    st.write("Rows waiting to be removed / มีข้อมูลรอการลบ" if pending else "Nothing waiting to be removed / ไม่มีข้อมูลรอการลบ")
+    if st.button("🧹 Remove now / ลบตอนนี้", disabled=not pending):
+        try:
+            removed = tombstones.compact(data_dir)
+            st.success(f"✅ Removed {removed:,} rows / ลบ {removed:,} แถว")
+        except Exception as e:
+            st.error(f"❌ Could not remove the rows: {e} / ไม่สามารถลบข้อมูลได้")
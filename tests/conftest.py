@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The app imports its helpers as `utils`, relative to the app folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import storage  # noqa: E402
+
+
+def employee_rows(employee_ids):
+    return pd.DataFrame({"employee_id": employee_ids,
+                         "name": [f"Name {employee_id}" for employee_id in employee_ids],
+                         "department": "Sales"})
+
+
+def evaluation_rows(employee_ids, year=2024, score=4.0):
+    return pd.DataFrame({"employee_id": employee_ids,
+                         "evaluator_type": "Manager / ผู้จัดการ",
+                         "evaluator_id": "M1",
+                         "evaluation_year": year,
+                         "criteria": "Teamwork",
+                         "type": "rating",
+                         "score": score,
+                         "department": "Sales"})
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A tenant folder with employees E1-E3 and one evaluation each."""
+    data_dir = str(tmp_path)
+    storage.ensure_schema(data_dir)
+    storage.save_employees(data_dir, employee_rows(["E1", "E2", "E3"]))
+    storage.append_evaluations(data_dir, evaluation_rows(["E1", "E2", "E3"]))
+    return data_dir
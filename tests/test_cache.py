@@ -0,0 +1,46 @@
+from utils.cache import TenantCache
+
+
+def _load(cache, tenant, name, stamp=1, size=100):
+    return cache.get(tenant, name, stamp, lambda: b"x" * size)
+
+
+def _names(cache, tenant):
+    return sorted(cache._tenants.get(tenant, {}))
+
+
+def test_reloads_when_stamp_changes():
+    cache = TenantCache(budget_bytes=10_000)
+    calls = []
+    for stamp in (1, 1, 2):
+        cache.get("a", "table", stamp, lambda: calls.append(stamp) or stamp)
+    assert calls == [1, 2]
+
+
+def test_evicts_least_recently_used_tenant_first():
+    cache = TenantCache(budget_bytes=500)
+    _load(cache, "a", "one")
+    _load(cache, "b", "one")
+    _load(cache, "a", "one")
+    _load(cache, "c", "one")
+    _load(cache, "c", "two")
+    assert cache.stats()["tenants"] == ["a", "c"]
+
+
+def test_single_tenant_stays_within_budget():
+    cache = TenantCache(budget_bytes=500)
+    for name in ("one", "two", "three"):
+        _load(cache, "a", name)
+    _load(cache, "a", "one")
+    _load(cache, "a", "four")
+
+    assert _names(cache, "a") == ["four", "one", "three"]
+    assert cache.stats()["bytes"] <= 500
+
+
+def test_entry_larger_than_budget_is_kept_alone():
+    cache = TenantCache(budget_bytes=350)
+    _load(cache, "a", "small")
+    _load(cache, "a", "large", size=1000)
+    assert _names(cache, "a") == ["large"]
+    assert cache.stats()["bytes"] == cache._tenants["a"]["large"][2]
@@ -0,0 +1,60 @@
+import io
+
+import pandas as pd
+import pytest
+
+from utils import engine
+
+CSV = (
+    'employee_id,evaluation_year,text_response\n'
+    'E1,2024,"first line\nsecond line"\n'
+    'E2,2024,plain\n'
+    'E3,2024,"says ""hi""\nthen leaves"\n'
+    'E4,2024,"""quoted"" start"\n'
+    'E5,2024,"\n\n"\n'
+    'E6,2024,last\n'
+)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    file_path = tmp_path / "evaluation_data.csv"
+    file_path.write_bytes(CSV.encode())
+    return str(file_path)
+
+
+def _read_ranges(file_path, ranges):
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        parts = []
+        for start, end in ranges:
+            f.seek(start)
+            parts.append(pd.read_csv(io.BytesIO(header + f.read(end - start)), dtype=str))
+    return parts
+
+
+@pytest.mark.parametrize("range_bytes", [1, 7, 20, 1000])
+def test_split_rows_keeps_quoted_newlines_in_their_row(csv_path, range_bytes):
+    ranges = engine.split_rows(csv_path, range_bytes=range_bytes)
+
+    header_end = len(CSV.split("\n", 1)[0]) + 1
+    assert ranges[0][0] == header_end
+    assert ranges[-1][1] == len(CSV.encode())
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    rows = pd.concat(_read_ranges(csv_path, ranges), ignore_index=True)
+    pd.testing.assert_frame_equal(rows, pd.read_csv(csv_path, dtype=str))
+
+
+def test_split_rows_one_range_per_row_when_ranges_are_tiny(csv_path):
+    parts = _read_ranges(csv_path, engine.split_rows(csv_path, range_bytes=1))
+    assert [list(part["employee_id"]) for part in parts] == [["E1"], ["E2"], ["E3"], ["E4"], ["E5"], ["E6"]]
+
+
+def test_split_rows_stops_at_size(csv_path):
+    # A reader of an older snapshot only sees the bytes committed then
+    size = CSV.index("E4")
+    ranges = engine.split_rows(csv_path, range_bytes=1, size=size)
+    assert ranges[-1][1] == size
+    rows = pd.concat(_read_ranges(csv_path, ranges), ignore_index=True)
+    assert list(rows["employee_id"]) == ["E1", "E2", "E3"]
+    assert rows.loc[2, "text_response"] == 'says "hi"\nthen leaves'
@@ -0,0 +1,61 @@
+import threading
+
+from conftest import employee_rows, evaluation_rows
+
+from utils import schema, snapshot, storage
+
+
+def _in_thread(func, *args):
+    # Writes from another session; the writing thread itself would re-pin to its own write
+    thread = threading.Thread(target=func, args=args)
+    thread.start()
+    thread.join()
+
+
+def _employee_ids(data_dir):
+    return list(storage.load_employees(data_dir)["employee_id"])
+
+
+def test_publish_keeps_earlier_versions_readable(data_dir):
+    before = snapshot.latest(data_dir)
+    storage.save_employees(data_dir, employee_rows(["E1", "E2", "E3", "E4"]))
+    after = snapshot.latest(data_dir)
+
+    assert after.version > before.version
+    with before.source(storage.EMPLOYEE_FILE) as f:
+        assert list(storage.read_table(f, schema.EMPLOYEE_SCHEMA)["employee_id"]) == ["E1", "E2", "E3"]
+    with after.source(storage.EMPLOYEE_FILE) as f:
+        assert list(storage.read_table(f, schema.EMPLOYEE_SCHEMA)["employee_id"]) == ["E1", "E2", "E3", "E4"]
+
+
+def test_publish_without_changes_keeps_the_version(data_dir):
+    version = snapshot.latest(data_dir).version
+    with storage.write_lock(data_dir):
+        pass
+    assert snapshot.latest(data_dir).version == version
+
+
+def test_pinned_reader_keeps_its_snapshot(data_dir):
+    snapshot.pin(data_dir)
+    _in_thread(storage.save_employees, data_dir, employee_rows(["E1"]))
+    assert _employee_ids(data_dir) == ["E1", "E2", "E3"]
+
+    snapshot.pin(data_dir)
+    assert _employee_ids(data_dir) == ["E1"]
+
+
+def test_pinned_reader_stops_at_committed_bytes_of_appended_file(data_dir):
+    snapshot.pin(data_dir)
+    _in_thread(storage.append_evaluations, data_dir, evaluation_rows(["E1", "E2"], year=2025))
+    assert storage.evaluation_years(data_dir) == [2024]
+    assert len(storage.load_evaluations(data_dir)) == 3
+
+    snapshot.pin(data_dir)
+    assert storage.evaluation_years(data_dir) == [2024, 2025]
+    assert len(storage.load_evaluations(data_dir)) == 5
+
+
+def test_writer_reads_its_own_write(data_dir):
+    snapshot.pin(data_dir)
+    storage.save_employees(data_dir, employee_rows(["E1"]))
+    assert _employee_ids(data_dir) == ["E1"]
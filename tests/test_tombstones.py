@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from conftest import employee_rows
+
+from utils import schema, snapshot, storage, tombstones
+
+
+@pytest.fixture(autouse=True)
+def no_background_compaction(monkeypatch):
+    # Compaction runs when the tests call it, not in a thread racing their assertions
+    monkeypatch.setattr(tombstones, "compact_in_background", lambda data_dir: None)
+
+
+def _file_ids(data_dir, name, table_schema):
+    return set(storage.read_table(storage.path(data_dir, name), table_schema)["employee_id"])
+
+
+def _visible(data_dir):
+    snapshot.pin(data_dir)
+    return (set(storage.load_employees(data_dir)["employee_id"]),
+            set(storage.load_evaluations(data_dir)["employee_id"]))
+
+
+def test_delete_hides_employee_before_compaction(data_dir):
+    assert tombstones.delete_employee(data_dir, "E2", "Name E2", "Sales")
+    assert not tombstones.delete_employee(data_dir, "E2")
+
+    assert _visible(data_dir) == ({"E1", "E3"}, {"E1", "E3"})
+    assert tombstones.pending(data_dir)
+    # Only the tombstone was written
+    assert "E2" in _file_ids(data_dir, storage.EVALUATION_FILE, schema.EVALUATION_SCHEMA)
+
+
+def test_compact_moves_rows_to_deleted(data_dir):
+    tombstones.delete_employee(data_dir, "E2", "Name E2", "Sales")
+
+    assert tombstones.compact(data_dir) == 2
+    assert not tombstones.pending(data_dir)
+    assert "E2" not in _file_ids(data_dir, storage.EMPLOYEE_FILE, schema.EMPLOYEE_SCHEMA)
+    assert "E2" not in _file_ids(data_dir, storage.EVALUATION_FILE, schema.EVALUATION_SCHEMA)
+    deleted_dir = storage.path(data_dir, tombstones.DELETED_DIR)
+    kept = storage.read_table(os.path.join(deleted_dir, tombstones.DELETED_EVALUATIONS_FILE), schema.EVALUATION_SCHEMA)
+    assert list(kept["employee_id"]) == ["E2"]
+    assert _visible(data_dir) == ({"E1", "E3"}, {"E1", "E3"})
+    assert tombstones.compact(data_dir) == 0
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_restore_brings_employee_back(data_dir, compacted):
+    tombstones.delete_employee(data_dir, "E2", "Name E2", "Sales")
+    if compacted:
+        tombstones.compact(data_dir)
+
+    assert tombstones.restore_employee(data_dir, "E2")
+    assert not tombstones.restore_employee(data_dir, "E2")
+    assert _visible(data_dir) == ({"E1", "E2", "E3"}, {"E1", "E2", "E3"})
+    assert tombstones.load(data_dir).empty
+
+
+def test_employee_saved_again_stays_hidden_until_restored(data_dir):
+    tombstones.delete_employee(data_dir, "E2", "Name E2", "Sales")
+    tombstones.compact(data_dir)
+    storage.save_employees(data_dir, employee_rows(["E1", "E2", "E3"]))
+
+    assert _visible(data_dir)[0] == {"E1", "E3"}
+    tombstones.restore_employee(data_dir, "E2")
+    employees = storage.load_employees(data_dir)
+    assert list(employees["employee_id"]).count("E2") == 1
+
+
+def test_delete_leaves_derived_tables_for_a_rebuild(data_dir):
+    from utils import trends
+
+    trends.load(data_dir)
+    tombstones.delete_employee(data_dir, "E2", "Name E2", "Sales")
+    snapshot.pin(data_dir)
+    assert not trends.DERIVED.is_current(data_dir)
+
+    employee_yoy, _ = trends.load(data_dir)
+    assert set(employee_yoy["employee_id"]) == {"E1", "E3"}
+    assert trends.DERIVED.is_current(data_dir)
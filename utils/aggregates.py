@@ -0,0 +1,310 @@
+import functools
+
+import pandas as pd
+
+from utils import archive, engine, schema, storage, trends
+
+SELF_EVALUATOR = "Self / ตัวเอง"
+SUM_COLUMNS = ["score_sum", "score_count"]
+
+
+def _criteria(data_dir):
+    config = storage.load_config(data_dir)
+    criteria_df = storage.load_criteria(data_dir, config.get("use_custom", False))
+    if criteria_df is None:
+        return storage.empty_table(schema.CRITERIA_SCHEMA)
+    return criteria_df
+
+
+def _with_mean(table, sum_col="score_sum", count_col="score_count", mean_col="score"):
+    return table.assign(**{mean_col: table[sum_col] / table[count_col]})
+
+
+# Builders turn evaluation rows into per-year aggregate tables. Archived years keep the
+# output of the same builders (see utils/archive.py), so every table here is the open
+# years' rows aggregated on demand plus the stored tables of the archived years.
+def _build_criteria_averages(rows):
+    scored = rows.dropna(subset=["score"])
+    table = (
+        scored.groupby(["evaluation_year", "criteria"])["score"]
+        .agg(score_sum="sum", score_count="count")
+        .reset_index()
+    )
+    return _with_mean(table)
+
+
+def _build_employee_scores(rows):
+    scored = rows.dropna(subset=["score"])
+    scored = scored.assign(is_self=scored["evaluator_type"] == SELF_EVALUATOR)
+    return (
+        scored.groupby(["employee_id", "evaluation_year", "criteria", "is_self"])["score"]
+        .agg(score_sum="sum", score_count="count")
+        .reset_index()
+    )
+
+
+def _build_employee_evaluators(rows):
+    return rows[["employee_id", "evaluation_year", "evaluator_id"]].drop_duplicates().reset_index(drop=True)
+
+
+def _build_group_scores(rows):
+    scored = rows.dropna(subset=["score"])
+    return (
+        scored.groupby(["evaluation_year", "department", "evaluator_type", "criteria"], dropna=False)["score"]
+        .agg(score_sum="sum", score_count="count")
+        .reset_index()
+    )
+
+
+def _build_goal_values(rows):
+    numeric = rows.dropna(subset=["value"])
+    return (
+        numeric.groupby(["employee_id", "department", "evaluation_year", "criteria"], dropna=False)["value"]
+        .agg(value_sum="sum", value_count="count")
+        .reset_index()
+    )
+
+
+SUMMARY_BUILDERS = {
+    "criteria_averages": _build_criteria_averages,
+    "employee_scores": _build_employee_scores,
+    "employee_evaluators": _build_employee_evaluators,
+    "group_scores": _build_group_scores,
+    "goal_values": _build_goal_values,
+}
+
+
+def _parallel_score_sums(data_dir, keys):
+    stats = engine.group_stats(data_dir, keys, "score", include_archived=False)
+    return stats.rename(columns={"sum": "score_sum", "count": "score_count"})[keys + SUM_COLUMNS]
+
+
+def _parallel_criteria_averages(data_dir):
+    return _with_mean(_parallel_score_sums(data_dir, ["evaluation_year", "criteria"]))
+
+
+def _parallel_group_scores(data_dir):
+    return _parallel_score_sums(data_dir, ["evaluation_year", "department", "evaluator_type", "criteria"])
+
+
+def _parallel_build(data_dir, name, columns):
+    # The builder runs on each range of the file in the workers; its partial tables are merged here
+    parts = engine.map_rows(data_dir, SUMMARY_BUILDERS[name], columns, include_archived=False)
+    return pd.concat(parts or [SUMMARY_BUILDERS[name](storage.empty_table(schema.EVALUATION_SCHEMA))],
+                     ignore_index=True)
+
+
+def _parallel_employee_scores(data_dir):
+    keys = ["employee_id", "evaluation_year", "criteria", "is_self"]
+    parts = _parallel_build(data_dir, "employee_scores", ["employee_id", "evaluation_year", "criteria",
+                                                          "evaluator_type", "score"])
+    return parts.groupby(keys)[SUM_COLUMNS].sum().reset_index()
+
+
+def _parallel_employee_evaluators(data_dir):
+    parts = _parallel_build(data_dir, "employee_evaluators", ["employee_id", "evaluation_year", "evaluator_id"])
+    return parts.drop_duplicates().reset_index(drop=True)
+
+
+def _parallel_goal_values(data_dir):
+    keys = ["employee_id", "department", "evaluation_year", "criteria"]
+    parts = _parallel_build(data_dir, "goal_values", keys + ["value"])
+    return parts.groupby(keys, dropna=False)[["value_sum", "value_count"]].sum().reset_index()
+
+
+# Used instead of the builders above when the open years' data is large (see utils/engine.py)
+PARALLEL_BUILDERS = {
+    "criteria_averages": _parallel_criteria_averages,
+    "employee_scores": _parallel_employee_scores,
+    "employee_evaluators": _parallel_employee_evaluators,
+    "group_scores": _parallel_group_scores,
+    "goal_values": _parallel_goal_values,
+}
+
+
+def _aggregate(data_dir, name):
+    def build():
+        if engine.use_parallel(data_dir, include_archived=False):
+            table = PARALLEL_BUILDERS[name](data_dir)
+        else:
+            table = SUMMARY_BUILDERS[name](storage.load_evaluations(data_dir))
+        archived = archive.load_summary(data_dir, name)
+        if archived is None or archived.empty:
+            return table
+        return pd.concat([table, archived], ignore_index=True)
+
+    # Aggregates depend on every data file of the tenant, so any write invalidates them
+    return storage.cached(data_dir, "agg:" + name, storage.dataset_files(data_dir), build)
+
+
+def criteria_averages(data_dir):
+    """Company-wide score sum, count and mean per (year, criterion)."""
+    return _aggregate(data_dir, "criteria_averages")
+
+
+def employee_scores(data_dir):
+    """Score sum and count per (employee, year, criterion, self or others)."""
+    return _aggregate(data_dir, "employee_scores")
+
+
+def employee_evaluators(data_dir):
+    """Distinct (employee, year, evaluator) triples, for counting evaluators over any set of years."""
+    return _aggregate(data_dir, "employee_evaluators")
+
+
+def group_scores(data_dir):
+    """Score sum and count per (year, department, evaluator type, criterion)."""
+    return _aggregate(data_dir, "group_scores")
+
+
+def score_heatmap(data_dir, years, criteria, by_evaluator_type=False):
+    """Mean score with departments (and evaluator types) as rows and criteria as columns.
+
+    One groupby and pivot over the summary table, cached per dataset version and selection.
+    """
+    rows = ["department", "evaluator_type"] if by_evaluator_type else ["department"]
+
+    def build():
+        scores = group_scores(data_dir)
+        scores = scores[scores["evaluation_year"].isin(years) & scores["criteria"].isin(criteria)]
+        # Rows without a department or evaluator type get a "-" row instead of a missing label
+        scores = scores.assign(**{col: scores[col].fillna("-") for col in rows})
+        sums = scores.groupby(rows + ["criteria"])[SUM_COLUMNS].sum()
+        means = (sums["score_sum"] / sums["score_count"]).unstack("criteria")
+        return means.reindex(columns=[c for c in criteria if c in means.columns])
+
+    key = f"heatmap:{sorted(years)}:{list(criteria)}:{by_evaluator_type}"
+    return storage.cached(data_dir, key, storage.dataset_files(data_dir), build)
+
+
+def goal_values(data_dir):
+    """Numeric answer sum and count per (employee, department, year, criterion)."""
+    return _aggregate(data_dir, "goal_values")
+
+
+def department_scores(data_dir, department, years, criteria):
+    """Mean score per (year, criterion) of one department's evaluations in the given years."""
+    keys = ["evaluation_year", "criteria"]
+    filters = {"department": [department], "evaluation_year": list(years), "criteria": list(criteria)}
+    if engine.use_parallel(data_dir):
+        stats = engine.group_stats(data_dir, keys, "score", filters)
+    else:
+        stats = engine.merge_stats([engine.partial_stats(storage.load_evaluations(data_dir, years=years), keys, "score", filters)], keys)
+    return stats[keys + ["mean"]].rename(columns={"mean": "score"})
+
+
+def _employee_rows(employee_id, years, rows):
+    return rows[(rows["employee_id"] == employee_id) & rows["evaluation_year"].isin(years)]
+
+
+def employee_rows(data_dir, employee_id, years):
+    """Evaluation rows of one employee in the given years, archived ones included.
+
+    Once the data is large, worker processes pick them out of the files (see utils/engine.py).
+    """
+    years = list(years)
+    if engine.use_parallel(data_dir):
+        parts = engine.map_rows(data_dir, functools.partial(_employee_rows, employee_id, years), years=years)
+        if parts:
+            return pd.concat(parts, ignore_index=True)
+        return storage.empty_table(schema.EVALUATION_SCHEMA)
+    rows = storage.load_evaluations(data_dir, years=years)
+    return rows[rows["employee_id"] == employee_id].reset_index(drop=True)
+
+
+def goal_targets(data_dir):
+    """Target value per numeric criterion of the criteria set in use."""
+    criteria_df = _criteria(data_dir)
+    numeric = criteria_df[criteria_df["type"] == "numeric"]
+    return numeric.drop_duplicates("criteria").set_index("criteria")["target_value"]
+
+
+def goal_progress(data_dir, years=None, departments=None, employee_id=None):
+    """Average numeric answer and progress towards target per (year, criterion)."""
+    values = goal_values(data_dir)
+    targets = goal_targets(data_dir)
+    values = values[values["criteria"].isin(targets.index)]
+    if years is not None:
+        values = values[values["evaluation_year"].isin(years)]
+    if departments is not None:
+        values = values[values["department"].isin(departments)]
+    if employee_id is not None:
+        values = values[values["employee_id"] == employee_id]
+
+    progress = values.groupby(["evaluation_year", "criteria"])[["value_sum", "value_count"]].sum().reset_index()
+    progress = _with_mean(progress, "value_sum", "value_count", "average")
+    progress["target"] = progress["criteria"].map(targets)
+    progress["progress"] = (progress["average"] / progress["target"]).clip(upper=1.0).where(progress["target"] > 0)
+    return progress
+
+
+def criteria_trends(data_dir, criteria=None):
+    """Company-wide yearly mean and year-over-year change per rating criterion."""
+    criteria_df = _criteria(data_dir)
+    rating = criteria_df.loc[criteria_df["type"] == "rating", "criteria"].unique()
+    if criteria:
+        rating = [c for c in rating if c in criteria]
+    _, department_yoy = trends.load(data_dir)
+    return trends.yearly_means(department_yoy, rating)
+
+
+def employee_summary(data_dir, employee_id, years=None):
+    """Everything the employee dashboard shows for one employee, as plain tables."""
+    scores = employee_scores(data_dir)
+    scores = scores[scores["employee_id"] == employee_id]
+    evaluators = employee_evaluators(data_dir)
+    evaluators = evaluators[evaluators["employee_id"] == employee_id]
+    if years is not None:
+        scores = scores[scores["evaluation_year"].isin(years)]
+        evaluators = evaluators[evaluators["evaluation_year"].isin(years)]
+
+    by_year = _with_mean(scores.groupby(["evaluation_year", "criteria"])[SUM_COLUMNS].sum().reset_index())
+    by_group = scores.groupby(["criteria", "is_self"])[SUM_COLUMNS].sum()
+    self_vs_others = (
+        (by_group["score_sum"] / by_group["score_count"])
+        .unstack("is_self")
+        .reindex(columns=[True, False])
+        .rename(columns={True: "self", False: "others"})
+        .reset_index()
+    )
+    return {
+        "employee_id": employee_id,
+        "num_evaluators": int(evaluators["evaluator_id"].nunique()),
+        "criteria_averages": by_year,
+        "self_vs_others": self_vs_others,
+        "goal_progress": goal_progress(data_dir, years=years, employee_id=employee_id),
+    }
+
+
+def employee_comparison(data_dir, employee_ids, years=None):
+    """Scores of several employees side by side, for the comparison view of the employee dashboard.
+
+    One groupby over the selected employees' rows of the summary table gives, per
+    (employee, criterion), the mean over all evaluators, the self and others means and
+    the gap between them (self minus others).
+    """
+    scores = employee_scores(data_dir)
+    evaluators = employee_evaluators(data_dir)
+    selected = scores["employee_id"].isin(employee_ids)
+    selected_evaluators = evaluators["employee_id"].isin(employee_ids)
+    if years is not None:
+        selected &= scores["evaluation_year"].isin(years)
+        selected_evaluators &= evaluators["evaluation_year"].isin(years)
+
+    sums = scores[selected].groupby(["employee_id", "criteria", "is_self"])[SUM_COLUMNS].sum().unstack("is_self")
+    if sums.empty:
+        comparison = pd.DataFrame(columns=["employee_id", "criteria", "score", "self", "others", "gap"])
+    else:
+        score_sum = sums["score_sum"].reindex(columns=[True, False])
+        score_count = sums["score_count"].reindex(columns=[True, False])
+        comparison = pd.DataFrame({
+            "score": score_sum.sum(axis=1) / score_count.sum(axis=1),
+            "self": score_sum[True] / score_count[True],
+            "others": score_sum[False] / score_count[False],
+        })
+        comparison = comparison.assign(gap=comparison["self"] - comparison["others"]).reset_index()
+    return {
+        "scores": comparison,
+        "num_evaluators": evaluators[selected_evaluators].groupby("employee_id")["evaluator_id"].nunique(),
+    }
+
@@ -0,0 +1,178 @@
+"""Read-only JSON API for the dashboard aggregates.
+
+Run it on its own with ``python -m utils.api --port 8502`` from the app folder, or set
+PERF_TRACK_API_PORT so the Streamlit server starts it in the same process and both
+share one aggregate cache.
+
+Endpoints (all accept ``?tenant=<name>``, default ``default``):
+
+    GET /api/version
+    GET /api/employees/<employee_id>?year=2024&year=2025
+    GET /api/criteria-averages?year=2025
+    GET /api/goals?year=2025&department=Sales
+    GET /api/trends?criteria=Communication
+
+Every response carries an ETag derived from the tenant's dataset version; send it back
+in If-None-Match to get an empty 304 while the data is unchanged.
+"""
+import argparse
+import json
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from utils import aggregates, snapshot, storage, tenants
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.DataFrame):
+        return _records(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _years(params):
+    return [int(y) for y in params["year"]] if "year" in params else None
+
+
+def _filter_years(df, years):
+    return df if years is None else df[df["evaluation_year"].isin(years)]
+
+
+def not_found(data_dir, parts):
+    """Why an /api/... path split into parts does not exist, or None if it does."""
+    if parts in (["version"], ["criteria-averages"], ["goals"], ["trends"]):
+        return None
+    if len(parts) == 2 and parts[0] == "employees":
+        if (storage.load_employees(data_dir)["employee_id"] == parts[1]).any():
+            return None
+        return f"Unknown employee '{parts[1]}'"
+    return "Unknown path"
+
+
+def route(data_dir, parts, params):
+    """Payload for an /api/... path split into parts, or None for an unknown path."""
+    if parts == ["version"]:
+        return {"version": storage.dataset_version(data_dir)}
+    if len(parts) == 2 and parts[0] == "employees":
+        return aggregates.employee_summary(data_dir, parts[1], years=_years(params))
+    if parts == ["criteria-averages"]:
+        return _filter_years(aggregates.criteria_averages(data_dir), _years(params))
+    if parts == ["goals"]:
+        return aggregates.goal_progress(data_dir, years=_years(params), departments=params.get("department"))
+    if parts == ["trends"]:
+        return aggregates.criteria_trends(data_dir, params.get("criteria"))
+    return None
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "PerformanceTrackAPI/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        if not parts or parts[0] != "api":
+            return self._send_error(HTTPStatus.NOT_FOUND, "Unknown path")
+
+        tenant = params.get("tenant", [tenants.DEFAULT_TENANT])[0]
+        if tenant not in tenants.list_tenants():
+            return self._send_error(HTTPStatus.NOT_FOUND, f"Unknown tenant '{tenant}'")
+        data_dir = tenants.tenant_dir(tenant)
+        try:
+            storage.ensure_schema(data_dir)
+            snapshot.pin(data_dir)
+            # Only existing resources are revalidated, so an unknown path is never a 304
+            reason = not_found(data_dir, parts[1:])
+            if reason is not None:
+                return self._send_error(HTTPStatus.NOT_FOUND, reason)
+
+            etag = f'"{storage.dataset_version(data_dir)}"'
+            if etag in self._if_none_match():
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            payload = route(data_dir, parts[1:], params)
+        except ValueError as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        except Exception as e:
+            return self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}")
+        self._send_json(HTTPStatus.OK, payload, etag)
+
+    def _if_none_match(self):
+        header = self.headers.get("If-None-Match", "")
+        return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+    def _send_json(self, status, payload, etag=None):
+        body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            # Clients may keep the response but must revalidate it before reuse
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {"error": message})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    return ThreadingHTTPServer((host, port), ApiHandler)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_in_background():
+    """Start the API in a daemon thread of this process once, if PERF_TRACK_API_PORT is set."""
+    global _server
+    port = os.environ.get("PERF_TRACK_API_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = make_server(os.environ.get("PERF_TRACK_API_HOST", DEFAULT_HOST), int(port))
+            threading.Thread(target=_server.serve_forever, name="perf-track-api", daemon=True).start()
+    return _server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve dashboard aggregates as JSON.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
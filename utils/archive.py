@@ -0,0 +1,270 @@
+"""Archive closed evaluation years out of evaluation_data.csv.
+
+Each archived year is stored as one compressed partition under archive/ (Parquet when
+pyarrow is installed, gzip CSV otherwise). The per-year aggregate tables the dashboards
+use are computed once at archive time and kept next to the partitions, so archived
+years show up in charts without their rows ever being loaded. Rows of an archived year
+are only read when a page asks for that year explicitly.
+
+Command line, from the app folder:
+
+    python -m utils.archive --list
+    python -m utils.archive --years 2020 2021 [--tenant acme]
+    python -m utils.archive --restore 2021 [--tenant acme]
+"""
+import argparse
+import datetime
+import json
+import os
+import uuid
+
+import pandas as pd
+
+from utils import schema, snapshot, storage
+
+ARCHIVE_DIR = "archive"
+MANIFEST_FILE = "manifest.json"
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def archive_dir(data_dir):
+    return storage.path(data_dir, ARCHIVE_DIR)
+
+
+def manifest_path(data_dir):
+    return os.path.join(archive_dir(data_dir), MANIFEST_FILE)
+
+
+def load_manifest(data_dir):
+    """{"years": {"2020": {"rows": ..., "file": ...}}, "summaries": {name: file}}"""
+    manifest_source = storage.source(data_dir, f"{ARCHIVE_DIR}/{MANIFEST_FILE}")
+    if manifest_source is None:
+        return {"years": {}, "summaries": {}}
+    return storage.read_json(manifest_source)
+
+
+def _write_manifest(file_path, manifest):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _save_manifest(data_dir, manifest):
+    storage.replace_file(manifest_path(data_dir), lambda p: _write_manifest(p, manifest))
+
+
+def archived_years(data_dir):
+    return sorted(int(year) for year in load_manifest(data_dir)["years"])
+
+
+def archived_row_count(data_dir):
+    return sum(entry["rows"] for entry in load_manifest(data_dir)["years"].values())
+
+
+def _write_frame(df, base_path):
+    # Every write gets a new file name, so snapshots pinned to an older manifest keep their files
+    base_path = f"{base_path}_{uuid.uuid4().hex[:8]}"
+    if _has_pyarrow():
+        file_path = base_path + ".parquet"
+        df.to_parquet(file_path, index=False, compression="zstd")
+    else:
+        file_path = base_path + ".csv.gz"
+        df.to_csv(file_path, index=False, compression="gzip")
+    return os.path.basename(file_path)
+
+
+def _read_frame(file_path, table_schema=None):
+    if file_path.endswith(".parquet"):
+        return pd.read_parquet(file_path)
+    dtype = schema.read_dtypes(table_schema) if table_schema else None
+    return pd.read_csv(file_path, dtype=dtype, compression="gzip")
+
+
+def _load_partition(data_dir, year, manifest=None):
+    # All rows stored for the year, deleted employees' rows included
+    manifest = manifest or load_manifest(data_dir)
+    entry = manifest["years"].get(str(year))
+    if entry is None:
+        return storage.empty_table(schema.EVALUATION_SCHEMA)
+    file_path = os.path.join(archive_dir(data_dir), entry["file"])
+    return storage.cached(data_dir, f"archive:{year}", [file_path],
+                          lambda: _read_frame(file_path, schema.EVALUATION_SCHEMA))
+
+
+def load_year(data_dir, year, manifest=None):
+    """Rows of one archived year, cached like the other tenant datasets."""
+    from utils import tombstones
+
+    manifest = manifest or load_manifest(data_dir)
+    employee_ids = tombstones.pending_ids(data_dir)
+    if str(year) not in manifest["years"] or not employee_ids:
+        return _load_partition(data_dir, year, manifest)
+    # Cached under the partition's own name, so the unfiltered rows are not kept next to these
+    file_path = os.path.join(archive_dir(data_dir), manifest["years"][str(year)]["file"])
+    return storage.cached(data_dir, f"archive:{year}", [file_path, tombstones.tombstone_path(data_dir)],
+                          lambda: tombstones.without(_read_frame(file_path, schema.EVALUATION_SCHEMA), employee_ids))
+
+
+def load_summary(data_dir, name):
+    """Precomputed aggregate table `name` for all archived years, or None if nothing is archived."""
+    from utils import tombstones
+
+    manifest = load_manifest(data_dir)
+    if not manifest["years"]:
+        return None
+    file_name = manifest["summaries"].get(name)
+    if file_name is None or tombstones.pending(data_dir):
+        # A table added after these years were archived, or employees deleted since and not
+        # compacted yet: build it from the partitions instead
+        from utils import aggregates
+
+        files = [manifest_path(data_dir), tombstones.tombstone_path(data_dir)]
+        return storage.cached(data_dir, f"archive-summary:{name}", files, lambda: aggregates.SUMMARY_BUILDERS[name](
+            pd.concat([load_year(data_dir, year, manifest) for year in manifest["years"]], ignore_index=True)))
+    file_path = os.path.join(archive_dir(data_dir), file_name)
+    return storage.cached(data_dir, f"archive-summary:{name}", [file_path], lambda: _read_frame(file_path))
+
+
+def _refresh_summaries(data_dir, manifest):
+    from utils import aggregates
+
+    years = sorted(manifest["years"])
+    rows = pd.concat([_load_partition(data_dir, year, manifest) for year in years], ignore_index=True) if years else None
+    for name, builder in aggregates.SUMMARY_BUILDERS.items():
+        old_file = manifest["summaries"].pop(name, None)
+        if old_file is not None:
+            snapshot.retire(data_dir, os.path.join(archive_dir(data_dir), old_file))
+        if rows is not None:
+            manifest["summaries"][name] = _write_frame(builder(rows), os.path.join(archive_dir(data_dir), f"summary_{name}"))
+
+
+def _write_partition(data_dir, manifest, year, rows):
+    key = str(year)
+    if key in manifest["years"]:
+        snapshot.retire(data_dir, os.path.join(archive_dir(data_dir), manifest["years"][key]["file"]))
+    file_name = _write_frame(rows.reset_index(drop=True), os.path.join(archive_dir(data_dir), f"evaluations_{year}"))
+    manifest["years"][key] = {"rows": len(rows), "file": file_name}
+
+
+def _add_to_partitions(data_dir, manifest, rows):
+    os.makedirs(archive_dir(data_dir), exist_ok=True)
+    for year, year_rows in rows.groupby("evaluation_year"):
+        if str(year) in manifest["years"]:
+            # Year archived before: merge the late rows into the existing partition
+            year_rows = pd.concat([_load_partition(data_dir, year, manifest), year_rows], ignore_index=True)
+        _write_partition(data_dir, manifest, year, year_rows)
+
+
+def remove_employee_rows(data_dir, employee_ids):
+    """Take the rows of the given employees out of the archive partitions and return them.
+
+    The caller holds storage.write_lock.
+    """
+    manifest = load_manifest(data_dir)
+    removed = []
+    for year in sorted(manifest["years"]):
+        rows = _load_partition(data_dir, year, manifest)
+        matches = rows["employee_id"].isin(employee_ids)
+        if matches.any():
+            removed.append(rows[matches])
+            _write_partition(data_dir, manifest, year, rows[~matches])
+    if removed:
+        _refresh_summaries(data_dir, manifest)
+        _save_manifest(data_dir, manifest)
+    return pd.concat(removed, ignore_index=True) if removed else storage.empty_table(schema.EVALUATION_SCHEMA)
+
+
+def add_rows(data_dir, rows):
+    """Put rows of archived years back into their partitions; returns the rows of other years.
+
+    The caller holds storage.write_lock.
+    """
+    manifest = load_manifest(data_dir)
+    archived = rows["evaluation_year"].astype(str).isin(list(manifest["years"]))
+    if archived.any():
+        _add_to_partitions(data_dir, manifest, rows[archived])
+        _refresh_summaries(data_dir, manifest)
+        _save_manifest(data_dir, manifest)
+    return rows[~archived]
+
+
+def archive_years(data_dir, years):
+    """Move the given closed years from evaluation_data.csv into archive partitions."""
+    current_year = datetime.date.today().year
+    years = sorted({int(year) for year in years})
+    if any(year >= current_year for year in years):
+        raise ValueError(f"Only years before {current_year} can be archived")
+
+    # Concurrent submits must not land between reading and rewriting evaluation_data.csv
+    with storage.write_lock(data_dir):
+        evaluation_path = storage.path(data_dir, storage.EVALUATION_FILE)
+        eval_df = storage.read_table(evaluation_path, schema.EVALUATION_SCHEMA)
+        to_archive = eval_df["evaluation_year"].isin(years)
+        if not to_archive.any():
+            return 0
+        source_before = storage.evaluation_source(data_dir)
+
+        manifest = load_manifest(data_dir)
+        _add_to_partitions(data_dir, manifest, eval_df[to_archive])
+        _refresh_summaries(data_dir, manifest)
+        _save_manifest(data_dir, manifest)
+
+        storage.write_table(eval_df[~to_archive], evaluation_path, schema.EVALUATION_SCHEMA)
+        # The derived tables count archived years too, so moving rows leaves them current
+        storage.carry_over_derived(data_dir, source_before)
+        return int(to_archive.sum())
+
+
+def restore_years(data_dir, years):
+    """Move archived years back into evaluation_data.csv."""
+    # Concurrent submits must not land between reading and rewriting evaluation_data.csv
+    with storage.write_lock(data_dir):
+        manifest = load_manifest(data_dir)
+        years = sorted({int(year) for year in years if str(year) in manifest["years"]})
+        if not years:
+            return 0
+        source_before = storage.evaluation_source(data_dir)
+
+        restored = pd.concat([_load_partition(data_dir, year) for year in years], ignore_index=True)
+        evaluation_path = storage.path(data_dir, storage.EVALUATION_FILE)
+        eval_df = storage.read_table(evaluation_path, schema.EVALUATION_SCHEMA)
+        storage.write_table(pd.concat([eval_df, restored], ignore_index=True), evaluation_path, schema.EVALUATION_SCHEMA)
+
+        for year in years:
+            entry = manifest["years"].pop(str(year))
+            snapshot.retire(data_dir, os.path.join(archive_dir(data_dir), entry["file"]))
+        _refresh_summaries(data_dir, manifest)
+        _save_manifest(data_dir, manifest)
+        storage.carry_over_derived(data_dir, source_before)
+        return len(restored)
+
+
+def main():
+    from utils import tenants
+
+    parser = argparse.ArgumentParser(description="Archive or restore closed evaluation years.")
+    parser.add_argument("--tenant", default=tenants.DEFAULT_TENANT)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--years", type=int, nargs="+", help="years to archive")
+    group.add_argument("--restore", type=int, nargs="+", help="archived years to move back")
+    group.add_argument("--list", action="store_true", help="show archived years")
+    args = parser.parse_args()
+
+    data_dir = tenants.tenant_dir(args.tenant)
+    storage.ensure_schema(data_dir)
+    if args.years:
+        print(f"Archived {archive_years(data_dir, args.years)} rows.")
+    elif args.restore:
+        print(f"Restored {restore_years(data_dir, args.restore)} rows.")
+    for year, entry in sorted(load_manifest(data_dir)["years"].items()):
+        print(f"{year}: {entry['rows']} rows ({entry['file']})")
+
+
+if __name__ == "__main__":
+    main()
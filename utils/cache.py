@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget shared by all tenants' cached datasets and aggregates
+DEFAULT_BUDGET_MB = 512
+
+
+def estimate_nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class TenantCache:
+    """Per-tenant cache of loaded datasets with least-recently-used eviction.
+
+    Entries are stored with a stamp (e.g. file modification times); a lookup whose
+    stamp differs from the stored one reloads the value. When the total size exceeds
+    the budget, whole tenants are evicted starting from the least recently used one,
+    then the least recently used entries of the tenant still cached, down to the entry
+    just stored.
+    """
+
+    def __init__(self, budget_bytes, max_tenants=None):
+        self.budget_bytes = budget_bytes
+        self.max_tenants = max_tenants
+        self._tenants = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, tenant, name, stamp, loader):
+        with self._lock:
+            entries = self._tenants.get(tenant)
+            if entries is not None:
+                self._tenants.move_to_end(tenant)
+                hit = entries.get(name)
+                if hit is not None and hit[0] == stamp:
+                    entries.move_to_end(name)
+                    return hit[1]
+
+        # Load outside the lock so a slow tenant does not block the others
+        value = loader()
+        nbytes = estimate_nbytes(value)
+
+        with self._lock:
+            entries = self._tenants.setdefault(tenant, OrderedDict())
+            self._tenants.move_to_end(tenant)
+            old = entries.pop(name, None)
+            if old is not None:
+                self._bytes -= old[2]
+            entries[name] = (stamp, value, nbytes)
+            self._bytes += nbytes
+            self._evict(keep=tenant)
+        return value
+
+    def peek(self, tenant, name):
+        """(stamp, value) stored for name, whatever its stamp, or None; for loaders that extend an older value."""
+        with self._lock:
+            hit = self._tenants.get(tenant, {}).get(name)
+            return hit and hit[:2]
+
+    def invalidate(self, tenant, name=None):
+        with self._lock:
+            entries = self._tenants.get(tenant)
+            if entries is None:
+                return
+            names = list(entries) if name is None else [name]
+            for n in names:
+                old = entries.pop(n, None)
+                if old is not None:
+                    self._bytes -= old[2]
+            if not entries:
+                del self._tenants[tenant]
+
+    def _evict(self, keep):
+        while len(self._tenants) > 1 and (
+            self._bytes > self.budget_bytes
+            or (self.max_tenants is not None and len(self._tenants) > self.max_tenants)
+        ):
+            oldest = next(iter(self._tenants))
+            if oldest == keep:
+                self._tenants.move_to_end(oldest)
+                continue
+            entries = self._tenants.pop(oldest)
+            self._bytes -= sum(entry[2] for entry in entries.values())
+        # Per-selection entries (e.g. heatmaps) and values of older snapshots pile up within one tenant too
+        entries = self._tenants.get(keep, {})
+        while self._bytes > self.budget_bytes and len(entries) > 1:
+            _, (_, _, nbytes) = entries.popitem(last=False)
+            self._bytes -= nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tenants": list(self._tenants),
+                "entries": sum(len(entries) for entries in self._tenants.values()),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget_bytes,
+            }
+
+
+# One cache per server process, shared by every session
+CACHE = TenantCache(
+    budget_bytes=int(float(os.environ.get("PERF_TRACK_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024),
+    max_tenants=int(os.environ["PERF_TRACK_MAX_TENANTS"]) if os.environ.get("PERF_TRACK_MAX_TENANTS") else None,
+)
@@ -0,0 +1,182 @@
+"""Evaluation coverage: which employees are still waiting for which evaluations.
+
+coverage.csv lists the (employee_id, evaluation_year, evaluator_type) combinations that
+have at least one evaluation row, archived years included. It is rebuilt from the
+evaluation history when stale and extended on every submit by appending the submitted
+combinations, so a submit adds a line or two however long the history is. A combination
+can appear more than once until the next rebuild; `report` does not mind.
+
+The file is appended in place like evaluation_data.csv. It and coverage_meta.json are
+published with the other data files (see utils/snapshot.py), so a rerun reads the
+combinations of its snapshot.
+"""
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import storage
+from utils.cache import CACHE
+
+COVERAGE_FILE = "coverage.csv"
+COVERAGE_META_FILE = "coverage_meta.json"
+DERIVED = storage.DerivedTable("coverage", COVERAGE_META_FILE)
+KEYS = ["employee_id", "evaluation_year", "evaluator_type"]
+
+# The evaluator types the evaluation form offers; everyone is expected to get one of each by default
+EVALUATOR_TYPES = ["Self / ตัวเอง", "Manager / ผู้จัดการ", "Peer / เพื่อนร่วมงาน", "Subordinate / ลูกน้อง"]
+
+
+def _combinations(rows):
+    return rows[KEYS].drop_duplicates()
+
+
+def _build(data_dir):
+    # The combinations of the full evaluation history of the snapshot the thread reads, typed like _parse's
+    from utils import engine
+
+    if engine.use_parallel(data_dir):
+        # Large histories are reduced range by range in worker processes
+        table = _combinations(pd.concat(engine.map_rows(data_dir, _combinations, KEYS), ignore_index=True))
+    else:
+        table = _combinations(storage.load_history(data_dir))
+    return table.reset_index(drop=True).astype({"employee_id": "category", "evaluator_type": "category"})
+
+
+def rebuild(data_dir):
+    """Build the combination table from the full evaluation history, archived years included.
+
+    The caller holds the write lock.
+    """
+    source = storage.evaluation_source(data_dir)
+    table = _build(data_dir)
+    storage.replace_file(storage.path(data_dir, COVERAGE_FILE), lambda p: table.to_csv(p, index=False))
+    DERIVED.save_meta(data_dir, source)
+    # Cached as if read back, so the next submit's lines extend it instead of a full parse
+    return CACHE.get(os.path.abspath(data_dir), "coverage", _locate(data_dir)[1], lambda: table)
+
+
+def update(data_dir, new_rows, previous_source):
+    """Append the combinations of rows just appended to the evaluation file.
+
+    previous_source is storage.evaluation_source from before they were appended; a table
+    that was already stale is left for `load` to rebuild. The caller holds the write lock.
+    """
+    if not DERIVED.is_current(data_dir, previous_source):
+        return
+    _combinations(new_rows).to_csv(storage.path(data_dir, COVERAGE_FILE), mode="a", header=False, index=False)
+    DERIVED.save_meta(data_dir, storage.evaluation_source(data_dir))
+
+
+def _parse(file_source, **kwargs):
+    # Categorical ids are matched against the employee list once per distinct id, not once per line
+    return pd.read_csv(file_source, dtype={"employee_id": "category", "evaluation_year": "int64",
+                                           "evaluator_type": "category"}, **kwargs)
+
+
+def _append_categorical(column, values):
+    # Existing codes stay as they are; only ids not seen before become new categories
+    categories = column.cat.categories
+    categories = categories.append(pd.Index(values.dropna().unique()).difference(categories))
+    codes = np.concatenate([column.cat.codes.to_numpy(), categories.get_indexer(values)])
+    return pd.Categorical.from_codes(codes, categories)
+
+
+def _extend(table, file_path, start, end):
+    # The lines appended between two snapshots of the same file
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        tail = pd.read_csv(io.BytesIO(f.read(end - start)), header=None, names=KEYS,
+                           dtype={"employee_id": "str", "evaluation_year": "int64", "evaluator_type": "str"})
+    return pd.DataFrame({
+        "employee_id": _append_categorical(table["employee_id"], tail["employee_id"]),
+        "evaluation_year": np.concatenate([table["evaluation_year"].to_numpy(), tail["evaluation_year"].to_numpy()]),
+        "evaluator_type": _append_categorical(table["evaluator_type"], tail["evaluator_type"]),
+    })
+
+
+def _locate(data_dir):
+    # (path, (inode, committed bytes)) of coverage.csv in the snapshot the thread reads, or None
+    from utils import snapshot
+
+    located = snapshot.current(data_dir).locate(COVERAGE_FILE)
+    if located is None:
+        return None
+    file_path, size = located
+    return file_path, (os.stat(file_path).st_ino, size)
+
+
+def _read_table(data_dir):
+    """The combination table of the snapshot the thread reads.
+
+    Stamped with the file's inode and committed bytes: the file only grows until the next
+    rebuild replaces it, so a table cached for a shorter version of the same file is
+    extended with the new lines instead of parsing the whole file after every submit.
+    """
+    located = _locate(data_dir)
+    if located is None:
+        return _parse(io.StringIO(",".join(KEYS)))
+    file_path, stamp = located
+    tenant = os.path.abspath(data_dir)
+    previous = CACHE.peek(tenant, "coverage")
+
+    def loader():
+        if previous is not None and previous[0][0] == stamp[0] and previous[0][1] < stamp[1]:
+            return _extend(previous[1], file_path, previous[0][1], stamp[1])
+        return _parse(storage.source(data_dir, COVERAGE_FILE))
+
+    return CACHE.get(tenant, "coverage", stamp, loader)
+
+
+def load(data_dir):
+    """Return the combination table, rebuilding it if it is missing or stale.
+
+    Staleness is judged from metadata (see storage.evaluation_source) rather than rows, so a
+    rerun after a submit reads neither the evaluation file nor all of coverage.csv. Like
+    trends.load, a stale table is served rather than waiting for a writer.
+    """
+    return DERIVED.load(data_dir, rebuild, _build, _read_table)
+
+
+def report(employee_df, table, year, evaluator_types=EVALUATOR_TYPES):
+    """Completion per department and the list of missing evaluations for one year.
+
+    Every employee is expected to have an evaluation of each of `evaluator_types`.
+    Returns (completion, missing): completion has one row per current department with
+    employees, expected, completed, completion_rate and the rate per evaluator type;
+    missing has employee_id, name, department and evaluator_type of each evaluation
+    not given yet.
+    """
+    employees = employee_df.drop_duplicates("employee_id", keep="last").reset_index(drop=True)
+    types = pd.Index(evaluator_types)
+    present = table[table["evaluation_year"] == year]
+
+    # Anti-join by position: mark the present combinations in an employee x type grid,
+    # every unmarked cell is a missing evaluation. Combinations of people no longer on
+    # the employee list, or of other evaluator types, match no cell and drop out.
+    # Categories are looked up once each; the appended -1 is where missing values (code -1) land.
+    ids = present["employee_id"].astype("category").array
+    rows = np.append(pd.Index(employees["employee_id"]).get_indexer(ids.categories), -1)[ids.codes]
+    given = present["evaluator_type"].astype("category").array
+    cols = np.append(types.get_indexer(given.categories), -1)[given.codes]
+    matched = (rows >= 0) & (cols >= 0)
+    done = np.zeros((len(employees), len(types)), dtype=bool)
+    done[rows[matched], cols[matched]] = True
+
+    department = employees["department"].fillna("-")
+    by_type = pd.DataFrame(done, columns=types).groupby(department).mean()
+    completion = pd.DataFrame({"employees": 1, "completed": done.sum(axis=1)}).groupby(department).sum()
+    completion = completion.assign(expected=completion["employees"] * len(types))
+    completion = completion.assign(completion_rate=completion["completed"] / completion["expected"])
+    completion = completion[["employees", "expected", "completed", "completion_rate"]].join(by_type)
+    completion = completion.rename_axis("department").reset_index()
+
+    employee_pos, type_pos = np.nonzero(~done)
+    missing = pd.DataFrame({
+        "employee_id": employees["employee_id"].take(employee_pos).reset_index(drop=True),
+        "name": employees["name"].take(employee_pos).reset_index(drop=True),
+        "department": department.take(employee_pos).reset_index(drop=True),
+        "evaluator_type": pd.Series(types.take(type_pos)),
+    })
+    return completion, missing
@@ -0,0 +1,253 @@
+"""Parallel, out-of-core group aggregation over the evaluation files.
+
+evaluation_data.csv is cut into byte ranges on row boundaries and every archived year
+is its own partition. Worker processes each parse one range or partition and reduce it
+to count, sum and sum of squares per group (or to another mergeable partial result, see
+`map_rows`); the parent only merges those small partial tables. A worker holds one range at a time and at most a few ranges per worker are in
+flight, so memory stays bounded however large the files get.
+
+Below PARALLEL_MIN_MB of evaluation data the pool costs more than it saves, and callers
+keep aggregating the cached in-memory frame (see `use_parallel`).
+"""
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from utils import schema, storage
+
+PARALLEL_MIN_MB = float(os.environ.get("PERF_TRACK_PARALLEL_MB", 64))
+MAX_WORKERS = int(os.environ.get("PERF_TRACK_WORKERS", 0)) or os.cpu_count() or 1
+# Bytes of CSV parsed by one task
+RANGE_BYTES = 32 * 1024 * 1024
+BLOCK_BYTES = 16 * 1024 * 1024
+
+STAT_COLUMNS = ["count", "sum", "sumsq"]
+
+
+def _archived_files(data_dir, years=None):
+    from utils import archive
+
+    manifest = archive.load_manifest(data_dir)
+    return [os.path.join(archive.archive_dir(data_dir), entry["file"])
+            for year, entry in sorted(manifest["years"].items())
+            if years is None or int(year) in years]
+
+
+def data_size(data_dir, include_archived=True):
+    """Bytes of evaluation data in the snapshot the thread reads: the open years' CSV plus, optionally, the archive."""
+    from utils import snapshot
+
+    evaluation = snapshot.current(data_dir).locate(storage.EVALUATION_FILE)
+    size = evaluation[1] if evaluation is not None else 0
+    if include_archived:
+        size += sum(os.path.getsize(f) for f in _archived_files(data_dir) if os.path.exists(f))
+    return size
+
+
+def use_parallel(data_dir, include_archived=True):
+    return data_size(data_dir, include_archived) >= PARALLEL_MIN_MB * 1024 * 1024
+
+
+def split_rows(file_path, range_bytes=RANGE_BYTES, size=None):
+    """(start, end) byte ranges of the data rows of a CSV file, each ending on a row boundary.
+
+    Text answers may contain newlines inside quotes, so a newline only ends a row when
+    the number of quote characters before it is even ("" escapes keep the parity).
+    Only the first `size` bytes are split when given.
+    """
+    size = os.path.getsize(file_path) if size is None else size
+    with open(file_path, "rb") as f:
+        f.readline()
+        start = f.tell()
+        ranges = []
+        target = start + range_bytes
+        offset, odd = start, False
+        while offset < size:
+            block = f.read(min(BLOCK_BYTES, size - offset))
+            if not block:
+                break
+            pos = max(target - offset, 0)
+            while pos < len(block):
+                pos = block.find(b"\n", pos)
+                if pos == -1:
+                    break
+                if (odd + block.count(b'"', 0, pos)) % 2 == 0:
+                    ranges.append((start, offset + pos + 1))
+                    start = offset + pos + 1
+                    target = start + range_bytes
+                    pos = max(target - offset, pos + 1)
+                else:
+                    pos += 1
+            odd = (odd + block.count(b'"')) % 2 == 1
+            offset += len(block)
+        if offset > start:
+            ranges.append((start, offset))
+    return ranges
+
+
+def _filter(rows, filters, deleted=None):
+    for col, allowed in (filters or {}).items():
+        rows = rows[rows[col].isin(allowed)]
+    if deleted:
+        rows = rows[~rows["employee_id"].isin(deleted)]
+    return rows
+
+
+def partial_stats(rows, keys, column, filters=None, deleted=None):
+    """Count, sum and sum of squares of `column` per group of keys, skipping the employees in `deleted`."""
+    rows = _filter(rows, filters, deleted).dropna(subset=[column])
+    return (
+        rows.assign(_square=rows[column] ** 2)
+        .groupby(keys, dropna=False)
+        .agg(count=(column, "count"), sum=(column, "sum"), sumsq=("_square", "sum"))
+        .reset_index()
+    )
+
+
+def merge_stats(partials, keys):
+    """Combine partial stats and add mean and sample standard deviation per group."""
+    partials = [p for p in partials if not p.empty]
+    if not partials:
+        return pd.DataFrame(columns=keys + STAT_COLUMNS + ["mean", "std"])
+    stats = pd.concat(partials, ignore_index=True).groupby(keys, dropna=False)[STAT_COLUMNS].sum().reset_index()
+    variance = (stats["sumsq"] - stats["sum"] ** 2 / stats["count"]) / (stats["count"] - 1)
+    return stats.assign(mean=stats["sum"] / stats["count"], std=variance.clip(lower=0) ** 0.5)
+
+
+def _read_range(file_path, start, end, names, usecols):
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    dtype = {col: kind for col, kind in schema.read_dtypes(schema.EVALUATION_SCHEMA).items()
+             if usecols is None or col in usecols}
+    return pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=usecols, dtype=dtype)
+
+
+def _read_partition(file_path):
+    from utils import archive
+
+    return archive._read_frame(file_path, schema.EVALUATION_SCHEMA)
+
+
+def _range_stats(file_path, start, end, names, keys, column, filters, deleted):
+    usecols = sorted(set(keys) | {column} | set(filters or {}) | ({"employee_id"} if deleted else set()))
+    return partial_stats(_read_range(file_path, start, end, names, usecols), keys, column, filters, deleted)
+
+
+def _partition_stats(file_path, keys, column, filters, deleted):
+    return partial_stats(_read_partition(file_path), keys, column, filters, deleted)
+
+
+def _range_apply(file_path, start, end, names, func, columns, deleted):
+    usecols = None if columns is None else sorted(set(columns) | ({"employee_id"} if deleted else set()))
+    return func(_filter(_read_range(file_path, start, end, names, usecols), None, deleted))
+
+
+def _partition_apply(file_path, func, columns, deleted):
+    return func(_filter(_read_partition(file_path), None, deleted))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_submit_lock = threading.Lock()
+# What workers see as __main__ when they start, see _submit
+_WORKER_MAIN = types.ModuleType("__main__")
+
+
+def _get_pool():
+    # One pool per server process, shared by all sessions
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a threaded server can hand a worker locks other threads held at that moment
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def _submit(pool, task):
+    # A forkserver worker imports the parent's __main__ when it starts, and Streamlit
+    # installs the page it is running as __main__: the worker would run the whole page.
+    # Workers are started by submit and only need utils, so they get an empty __main__.
+    with _submit_lock:
+        page = sys.modules["__main__"]
+        sys.modules["__main__"] = _WORKER_MAIN
+        try:
+            return pool.submit(*task)
+        finally:
+            # Unless a rerun installed its own page in the meantime
+            if sys.modules["__main__"] is _WORKER_MAIN:
+                sys.modules["__main__"] = page
+
+
+def _evaluation_ranges(data_dir):
+    # (path, column names, byte ranges) of the evaluation file in the snapshot this thread reads, or None
+    from utils import snapshot
+
+    evaluation = snapshot.current(data_dir).locate(storage.EVALUATION_FILE)
+    if evaluation is None:
+        return None
+    evaluation_path, size = evaluation
+    names = list(pd.read_csv(evaluation_path, nrows=0).columns)
+    return evaluation_path, names, split_rows(evaluation_path, size=size)
+
+
+def _run(tasks):
+    # At most a few tasks per worker are in flight, so finished results never pile up
+    pool = _get_pool()
+    results, pending = [], set()
+    for task in tasks:
+        if len(pending) >= 2 * MAX_WORKERS:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results += [future.result() for future in done]
+        pending.add(_submit(pool, task))
+    return results + [future.result() for future in wait(pending).done]
+
+
+def group_stats(data_dir, keys, column, filters=None, include_archived=True):
+    """Count, sum, sum of squares, mean and std of `column` per group, computed in worker processes.
+
+    `filters` maps a column to the values to keep, e.g. {"department": ["Sales"]}. Rows of
+    deleted employees are skipped, like the loaders in storage do.
+    """
+    from utils import tombstones
+
+    deleted = tombstones.pending_ids(data_dir)
+    tasks = []
+    # Workers read the file of the snapshot this thread reads, up to its committed bytes
+    evaluation = _evaluation_ranges(data_dir)
+    if evaluation is not None:
+        evaluation_path, names, ranges = evaluation
+        tasks += [(_range_stats, evaluation_path, start, end, names, keys, column, filters, deleted)
+                  for start, end in ranges]
+    if include_archived:
+        years = (filters or {}).get("evaluation_year")
+        tasks += [(_partition_stats, file_path, keys, column, filters, deleted)
+                  for file_path in _archived_files(data_dir, years)]
+    return merge_stats(_run(tasks), keys)
+
+
+def map_rows(data_dir, func, columns=None, include_archived=True, years=None):
+    """func applied in worker processes to the rows of every range and archived partition.
+
+    Returns the list of results, for the caller to merge. func must be a module-level
+    function (or a functools.partial of one), since it is sent to the workers by name; it
+    gets at least `columns` of the rows (all when None), without those of deleted employees.
+    `years` limits the archived partitions read; open years' rows are not filtered.
+    """
+    from utils import tombstones
+
+    deleted = tombstones.pending_ids(data_dir)
+    tasks = []
+    evaluation = _evaluation_ranges(data_dir)
+    if evaluation is not None:
+        evaluation_path, names, ranges = evaluation
+        tasks += [(_range_apply, evaluation_path, start, end, names, func, columns, deleted) for start, end in ranges]
+    if include_archived:
+        tasks += [(_partition_apply, file_path, func, columns, deleted) for file_path in _archived_files(data_dir, years)]
+    return _run(tasks)
@@ -0,0 +1,121 @@
+import os
+import tempfile
+
+import streamlit as st
+
+# Rows per chunk written to the export file
+CHUNK_ROWS = 50_000
+# Excel sheets hold at most 1,048,576 rows (including the header)
+XLSX_MAX_ROWS = 1_048_575
+
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def available_formats():
+    """Export formats usable in this environment (Parquet needs pyarrow)."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return [fmt for fmt in EXPORT_FORMATS if fmt != "Parquet"]
+    return list(EXPORT_FORMATS)
+
+
+def iter_chunks(df, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df, out):
+    # UTF-8 BOM so Excel shows the Thai captions correctly
+    out.write(b"\xef\xbb\xbf")
+    header = True
+    for chunk in iter_chunks(df):
+        out.write(chunk.to_csv(index=False, header=header).encode("utf-8"))
+        header = False
+    if header:
+        out.write(df.head(0).to_csv(index=False).encode("utf-8"))
+
+
+def write_parquet(df, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Object columns hold mixed values (e.g. NaN and text), store them as strings
+    object_cols = df.select_dtypes(include="object").columns
+
+    def to_table(chunk, schema=None):
+        chunk = chunk.astype({col: "string" for col in object_cols})
+        return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+    schema = to_table(df.head(0)).schema
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for chunk in iter_chunks(df):
+            writer.write_table(to_table(chunk, schema))
+
+
+def write_xlsx(df, out):
+    from openpyxl import Workbook
+
+    # Write-only workbooks stream rows to disk instead of keeping cells in memory
+    wb = Workbook(write_only=True)
+    ws = None
+    rows_in_sheet = XLSX_MAX_ROWS
+    for chunk in iter_chunks(df):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            if rows_in_sheet >= XLSX_MAX_ROWS:
+                ws = wb.create_sheet(f"data_{len(wb.worksheets) + 1}")
+                ws.append(list(df.columns))
+                rows_in_sheet = 0
+            ws.append(row)
+            rows_in_sheet += 1
+    if ws is None:
+        wb.create_sheet("data_1").append(list(df.columns))
+    wb.save(out)
+
+
+WRITERS = {"CSV": write_csv, "Parquet": write_parquet, "Excel": write_xlsx}
+
+
+def export_file(df, fmt):
+    """Write df chunk by chunk to a temporary file and return its contents.
+
+    Streamlit holds a download's bytes in memory either way; the file is closed before
+    it is removed so that this also works on Windows.
+    """
+    fd, path = tempfile.mkstemp(suffix="." + EXPORT_FORMATS[fmt][0])
+    try:
+        with open(fd, "wb") as out:
+            WRITERS[fmt](df, out)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def render_export(frames, base_name, key):
+    """Download buttons for each named frame; files are generated only when clicked.
+
+    A frame may also be given as a function returning it, so that rows which the page
+    does not otherwise need are only filtered out of the dataset on download.
+    """
+    with st.expander("📥 Export data / ส่งออกข้อมูล"):
+        fmt = st.selectbox("File format / รูปแบบไฟล์", available_formats(), key=f"{key}_format")
+        extension, mime = EXPORT_FORMATS[fmt]
+        cols = st.columns(len(frames))
+        for col, (label, df) in zip(cols, frames.items()):
+            deferred = callable(df)
+            with col:
+                st.download_button(
+                    f"⬇️ {label}" if deferred else f"⬇️ {label} ({len(df):,} rows)",
+                    data=lambda df=df, deferred=deferred: export_file(df() if deferred else df, fmt),
+                    file_name=f"{base_name}_{label.lower()}.{extension}",
+                    mime=mime,
+                    key=f"{key}_{label}",
+                    on_click="ignore",
+                    disabled=not deferred and df.empty,
+                )
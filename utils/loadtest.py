@@ -0,0 +1,283 @@
+"""Load test the app with simulated concurrent sessions on generated data.
+
+    python -m utils.loadtest --sessions 8 --duration 60
+    python -m utils.loadtest --sessions 32 --duration 120 --employees 500 --rows 200000 --mix form=2,employee=1,company=1
+
+Every session is a process driving the pages through streamlit.testing AppTest (AppTest
+swaps process-wide runtime state on each run, so it cannot serve several sessions from
+threads of one process). Each session therefore has its own caches, like a server
+process of its own, while all of them read and write the same tenant files. Sessions
+pick actions at random according to --mix: submit the evaluation form, browse the
+employee dashboard, or switch sections of the company dashboard. Each rerun is timed.
+
+The run uses a throwaway tenant under tenants/ (removed afterwards unless --keep). At
+the end every submission is looked up in evaluation_data.csv by its unique evaluator ID
+to report lost, duplicated or partially written submissions.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import coverage, schema, sketches, storage, tenants, trends
+
+PAGES_DIR = os.path.join(storage.APP_DIR, "pages")
+FORM_PAGE = os.path.join(PAGES_DIR, "1_📝_Form.py")
+EMPLOYEE_DASHBOARD_PAGE = os.path.join(PAGES_DIR, "3_📊_employee_dashboard.py")
+COMPANY_DASHBOARD_PAGE = os.path.join(PAGES_DIR, "4_🏢_company_dashboard.py")
+
+DEPARTMENTS = ["Finance/Accounting", "HR", "IT", "Marketing", "Sales", "Operations"]
+EVALUATOR_TYPES = ["Self / ตัวเอง", "Manager / ผู้จัดการ", "Peer / เพื่อนร่วมงาน", "Subordinate / ลูกน้อง"]
+EVALUATOR_PREFIX = "loadtest-"
+DEFAULT_MIX = "form=1,employee=2,company=2"
+
+
+def generate_tenant(name, employees, rows, years=3, seed=0):
+    """Create tenants/<name> with random employees and about `rows` evaluation rows."""
+    rng = np.random.default_rng(seed)
+    data_dir = tenants.tenant_dir(name)
+    os.makedirs(data_dir)
+
+    employee_df = pd.DataFrame({
+        "employee_id": [f"E{i:05d}" for i in range(employees)],
+        "name": [f"Employee {i}" for i in range(employees)],
+        "department": rng.choice(DEPARTMENTS, employees),
+    })
+    storage.save_employees(data_dir, employee_df)
+    storage.save_config(data_dir, {"use_custom": False})
+    storage.ensure_schema(data_dir)
+
+    # One generated evaluation covers every question the form shows for the employee
+    criteria_df = storage.load_criteria(data_dir, use_custom=False)
+    questions = {dept: criteria_df[criteria_df["department"].isin(["Core", dept])] for dept in DEPARTMENTS}
+    current_year = datetime.date.today().year
+    frames, total = [], 0
+    while total < rows:
+        employee = employee_df.iloc[rng.integers(employees)]
+        q = questions[employee["department"]]
+        n = len(q)
+        frames.append(pd.DataFrame({
+            "employee_id": employee["employee_id"],
+            "evaluator_type": rng.choice(EVALUATOR_TYPES),
+            "evaluator_id": f"G{total}",
+            "evaluation_year": current_year - 1 - int(rng.integers(years)),
+            "criteria": q["criteria"].to_numpy(),
+            "type": q["type"].to_numpy(),
+            "score": np.where(q["type"] == "rating", rng.integers(1, 6, n), np.nan),
+            "value": np.where(q["type"] == "numeric", rng.normal(q["target_value"].fillna(100), 10), np.nan),
+            "text_response": np.where(q["type"] == "text", "Generated comment\nwith a second line", None),
+            "department": employee["department"],
+        }))
+        total += n
+    storage.write_table(pd.concat(frames, ignore_index=True), storage.path(data_dir, storage.EVALUATION_FILE),
+                        schema.EVALUATION_SCHEMA)
+    return data_dir
+
+
+class Session:
+    """One simulated user: keeps an AppTest per page and reruns them like a browser tab would."""
+
+    def __init__(self, session_id, tenant, mix, deadline, timeout):
+        self.session_id = session_id
+        self.tenant = tenant
+        self.mix = mix
+        self.deadline = deadline
+        self.timeout = timeout
+        self.results = []
+        self.submissions = []
+        self.rng = random.Random(session_id)
+        self.apps = {}
+        self.submitted = 0
+
+    def _app(self, page):
+        from streamlit.testing.v1 import AppTest
+
+        if page not in self.apps:
+            app = AppTest.from_file(page, default_timeout=self.timeout)
+            app.query_params["tenant"] = self.tenant
+            self.apps[page] = app
+            self._run("open", app)
+        return self.apps[page]
+
+    def _run(self, action, app):
+        start = time.perf_counter()
+        try:
+            app.run()
+            ok = not app.exception
+        except Exception:
+            ok = False
+        self.results.append((action, time.perf_counter() - start, ok))
+        return ok
+
+    def _pick(self, app, widget):
+        widget.set_value(self.rng.choice(widget.options))
+
+    def submit_form(self):
+        app = self._app(FORM_PAGE)
+        self._pick(app, app.selectbox[0])
+        self._run("form", app)
+        self._pick(app, app.selectbox[1])
+        self._run("form", app)
+
+        evaluator_id = f"{EVALUATOR_PREFIX}{self.session_id}-{self.submitted}"
+        self.submitted += 1
+        self._pick(app, app.selectbox[2])
+        app.text_input[0].input(evaluator_id)
+        app.number_input[0].set_value(datetime.date.today().year)
+        for slider in app.slider:
+            slider.set_value(self.rng.randint(1, 5))
+        # Every question of the form becomes one row: ratings, numeric answers and text
+        expected_rows = len(app.slider) + len(app.number_input) - 1 + len(app.text_area)
+        app.button[0].click()
+        error = None
+        if not self._run("submit", app):
+            error = "page error"
+        elif not app.success:
+            error = app.error[0].value if app.error else "no confirmation shown"
+        self.submissions.append((evaluator_id, expected_rows, error))
+
+    def browse_employee(self):
+        app = self._app(EMPLOYEE_DASHBOARD_PAGE)
+        self._pick(app, app.selectbox[0])
+        self._run("employee", app)
+        self._pick(app, app.selectbox[1])
+        self._run("employee", app)
+
+    def browse_company(self):
+        app = self._app(COMPANY_DASHBOARD_PAGE)
+        for section in self.rng.sample(app.sidebar.radio[0].options, 3):
+            app.sidebar.radio[0].set_value(section)
+            self._run("company", app)
+
+    def run(self):
+        actions = {"form": self.submit_form, "employee": self.browse_employee, "company": self.browse_company}
+        names, weights = zip(*self.mix.items())
+        while time.time() < self.deadline:
+            try:
+                actions[self.rng.choices(names, weights)[0]]()
+            except Exception:
+                # A page that failed to render has no widgets to drive; start that page over
+                self.results.append(("error", 0.0, False))
+                self.apps.clear()
+        return self.results, self.submissions
+
+
+def run_session(session_id, tenant, mix, deadline, timeout):
+    return Session(session_id, tenant, mix, deadline, timeout).run()
+
+
+def check_integrity(data_dir, submissions):
+    """Compare the submitted evaluations with what ended up in evaluation_data.csv."""
+    rows = storage.read_table(storage.path(data_dir, storage.EVALUATION_FILE), schema.EVALUATION_SCHEMA)
+    counts = rows.loc[rows["evaluator_id"].str.startswith(EVALUATOR_PREFIX, na=False), "evaluator_id"].value_counts()
+    report = defaultdict(list)
+    for evaluator_id, expected_rows, error in submissions:
+        written = int(counts.get(evaluator_id, 0))
+        if error is not None:
+            # Saved rows behind an error message get submitted again by the user
+            label = "failed but written" if written else "failed"
+            report[label].append(f"{evaluator_id} [{error}]")
+        elif written == 0:
+            report["lost"].append(evaluator_id)
+        elif written < expected_rows:
+            report["partial"].append(evaluator_id)
+        elif written > expected_rows:
+            report["duplicated"].append(evaluator_id)
+    submitted_ids = {evaluator_id for evaluator_id, _, _ in submissions}
+    report["unexpected"] = sorted(set(counts.index) - submitted_ids)
+
+    # The incrementally maintained tables must account for exactly the rows on disk
+    on_disk = os.path.getsize(storage.path(data_dir, storage.EVALUATION_FILE))
+    for label, meta_file in [("trend tables", trends.YOY_META_FILE), ("sketches", sketches.SKETCH_META_FILE),
+                             ("coverage table", coverage.COVERAGE_META_FILE)]:
+        meta_path = storage.path(data_dir, meta_file)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                counted = json.load(f)["source"]["evaluations"]
+            if counted is None or counted[2] != on_disk:
+                report["stale derived tables"].append(f"{label}: {counted and counted[2]} bytes counted, {on_disk} on disk")
+    return len(rows), report
+
+
+def _percentiles(latencies):
+    return {f"p{p}": float(np.percentile(latencies, p)) * 1000 for p in (50, 95, 99)}
+
+
+def print_report(results, elapsed, submissions, total_rows, integrity):
+    print(f"\nDuration: {elapsed:.1f}s, reruns: {len(results)}, throughput: {len(results) / elapsed:.1f} reruns/s, "
+          f"submissions: {len(submissions)} ({len(submissions) / elapsed:.2f}/s)")
+    table = pd.DataFrame(results, columns=["action", "latency", "ok"])
+    summary = {"all": table}
+    summary.update({action: group for action, group in table.groupby("action")})
+    print(f"\n{'action':<10}{'reruns':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for action, group in summary.items():
+        p = _percentiles(group["latency"]) if len(group) else {"p50": 0, "p95": 0, "p99": 0}
+        print(f"{action:<10}{len(group):>8}{int((~group['ok']).sum()):>8}{p['p50']:>10.0f}{p['p95']:>10.0f}{p['p99']:>10.0f}")
+
+    print(f"\nIntegrity ({total_rows:,} rows on disk):")
+    problems = {label: ids for label, ids in integrity.items() if ids}
+    if not problems:
+        print("  OK - every submission written exactly once")
+    for label, ids in problems.items():
+        print(f"  {label}: {len(ids)}  e.g. {', '.join(map(str, ids[:5]))}")
+    return not problems
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"form", "employee", "company"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown actions: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent sessions against generated data.")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=50_000, help="generated evaluation rows")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX), help=f"action weights (default {DEFAULT_MIX})")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed for one rerun")
+    parser.add_argument("--tenant", default=None, help="name of the generated tenant")
+    parser.add_argument("--keep", action="store_true", help="keep the generated tenant afterwards")
+    args = parser.parse_args()
+
+    tenant = args.tenant or f"loadtest-{os.getpid()}"
+    print(f"Generating tenant '{tenant}' with {args.employees} employees and ~{args.rows:,} rows...")
+    data_dir = generate_tenant(tenant, args.employees, args.rows)
+    try:
+        results, submissions = [], []
+        print(f"Running {args.sessions} sessions for {args.duration:.0f}s...")
+        start = time.perf_counter()
+        deadline = time.time() + args.duration
+        with ProcessPoolExecutor(max_workers=args.sessions) as pool:
+            futures = [pool.submit(run_session, i, tenant, args.mix, deadline, args.timeout)
+                       for i in range(args.sessions)]
+            for future in futures:
+                session_results, session_submissions = future.result()
+                results += session_results
+                submissions += session_submissions
+        elapsed = time.perf_counter() - start
+
+        total_rows, integrity = check_integrity(data_dir, submissions)
+        ok = print_report(results, elapsed, submissions, total_rows, integrity)
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Import-time and first-paint benchmark for every page.
+
+    python -m utils.pagebench [--runs 3] [--tenant acme]
+
+Every measurement runs in a fresh interpreter with streamlit already imported, like the
+first view of a page after a server restart:
+
+    imports    the page's top-level import statements
+    first run  the page's first complete run through AppTest after those imports: data
+               loading, lazily imported modules and charts
+    rerun      a second run in the same process, with modules and caches warm
+
+Company dashboard sections are measured the same way: the page is opened on its default
+section, then the time to switch to the section is reported, so each section's lazily
+imported modules and data are still cold. Figures are medians over --runs.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from utils.storage import APP_DIR
+
+COMPANY_DASHBOARD = "4_🏢_company_dashboard.py"
+
+_PROBE = r"""
+import ast, json, sys, time
+import streamlit
+
+page, tenant, section = sys.argv[1], sys.argv[2], sys.argv[3]
+timings = {}
+
+tree = ast.parse(open(page, encoding="utf-8").read())
+imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+if section == "-":
+    start = time.perf_counter()
+    exec(compile(ast.Module(imports, type_ignores=[]), page, "exec"), {})
+    timings["imports"] = time.perf_counter() - start
+
+from streamlit.testing.v1 import AppTest
+
+app = AppTest.from_file(page, default_timeout=600)
+if tenant:
+    app.query_params["tenant"] = tenant
+start = time.perf_counter()
+app.run()
+timings["first_run"] = time.perf_counter() - start
+if section != "-":
+    app.sidebar.radio[0].set_value(section)
+    start = time.perf_counter()
+    app.run()
+    timings["first_run"] = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+timings["rerun"] = time.perf_counter() - start
+timings["ok"] = not app.exception
+print(json.dumps(timings))
+"""
+
+
+def _probe(page, tenant, section="-"):
+    env = dict(os.environ, PYTHONPATH=APP_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-c", _PROBE, page, tenant or "", section],
+                            cwd=APP_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(page)}: {result.stderr.strip().splitlines()[-1]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _company_sections(page):
+    # The section list is the options of the sidebar radio, read from the page source
+    import ast
+
+    tree = ast.parse(open(page, encoding="utf-8").read())
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and getattr(node.func, "attr", None) == "radio"
+                and len(node.args) > 1 and isinstance(node.args[1], ast.List)):
+            return [ast.literal_eval(element) for element in node.args[1].elts]
+    return []
+
+
+def benchmark(runs=3, tenant=None):
+    pages = [os.path.join(APP_DIR, "Welcome.py")] + sorted(glob.glob(os.path.join(APP_DIR, "pages", "*.py")))
+    targets = [(os.path.basename(page), page, "-") for page in pages]
+    company = os.path.join(APP_DIR, "pages", COMPANY_DASHBOARD)
+    targets += [(f"  › {section}", company, section) for section in _company_sections(company)[1:]]
+
+    for label, page, section in targets:
+        samples = [_probe(page, tenant, section) for _ in range(runs)]
+        row = {"page": label, "ok": all(s["ok"] for s in samples)}
+        for key in ("imports", "first_run", "rerun"):
+            if key in samples[0]:
+                row[key] = statistics.median(s[key] for s in samples) * 1000
+        yield row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and first paint of every page.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tenant", default=None)
+    args = parser.parse_args()
+
+    print(f"{'page':<40}{'imports ms':>12}{'first run ms':>14}{'rerun ms':>10}")
+    for row in benchmark(args.runs, args.tenant):
+        imports = f"{row['imports']:.0f}" if "imports" in row else "-"
+        status = "" if row["ok"] else "  (page error)"
+        print(f"{row['page']:<40}{imports:>12}{row['first_run']:>14.0f}{row['rerun']:>10.0f}{status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Bump when the normalization rules below change; stored as "schema_version" in config.json
+#   1 - typed, trimmed columns
+#   2 - evaluations carry the employee's department at evaluation time
+SCHEMA_VERSION = 2
+SCHEMA_VERSION_KEY = "schema_version"
+
+# Column kinds:
+#   key   - identifier or label, whitespace stripped
+#   lower - like key, also lower-cased
+#   text  - free text, kept as entered
+#   int   - whole number
+#   float - number, missing allowed
+# Each column maps to (kind, value used when the column or a cell is missing)
+EMPLOYEE_SCHEMA = {
+    "employee_id": ("key", None),
+    "name": ("key", None),
+    "department": ("key", None),
+}
+
+EVALUATION_SCHEMA = {
+    "employee_id": ("key", None),
+    "evaluator_type": ("key", None),
+    "evaluator_id": ("key", np.nan),
+    "evaluation_year": ("int", None),
+    "criteria": ("key", None),
+    "type": ("lower", "rating"),
+    "score": ("float", np.nan),
+    "value": ("float", np.nan),
+    "text_response": ("text", np.nan),
+    "department": ("key", np.nan),
+}
+
+CRITERIA_SCHEMA = {
+    "department": ("key", None),
+    "criteria": ("key", None),
+    "caption_eng": ("text", np.nan),
+    "caption_th": ("text", np.nan),
+    "type": ("lower", "rating"),
+    "target_value": ("float", np.nan),
+}
+
+READ_DTYPES = {"key": "str", "lower": "str", "text": "str", "int": "int64", "float": "float64"}
+
+
+def read_dtypes(schema):
+    """dtype argument for pd.read_csv so normalized files load without any cleaning pass."""
+    return {col: READ_DTYPES[kind] for col, (kind, _) in schema.items()}
+
+
+def _as_str(series):
+    return series.map(str, na_action="ignore").astype(object)
+
+
+def _normalize_column(series, kind, default):
+    if kind in ("key", "lower"):
+        series = _as_str(series).str.strip()
+        series = series.where(series != "")
+        if kind == "lower":
+            series = series.str.lower()
+    elif kind == "text":
+        series = _as_str(series)
+    elif kind == "int":
+        series = pd.to_numeric(series, errors="raise").astype("int64")
+    elif kind == "float":
+        series = pd.to_numeric(series, errors="coerce").astype("float64")
+    if default is not None:
+        series = series.fillna(default)
+    return series
+
+
+def normalize(df, schema):
+    """Return df with every declared column present, typed and cleaned; other columns follow unchanged."""
+    columns = {}
+    for col, (kind, default) in schema.items():
+        if col in df.columns:
+            series = df[col]
+        else:
+            series = pd.Series(default, index=df.index, dtype=object)
+        columns[col] = _normalize_column(series, kind, default)
+    extra = [col for col in df.columns if col not in schema]
+    return pd.concat([pd.DataFrame(columns, index=df.index), df[extra]], axis=1).reset_index(drop=True)
+
+
+def validate(df, schema):
+    """Raise ValueError if a column without a default has missing values."""
+    for col, (_, default) in schema.items():
+        if default is None and df[col].isna().any():
+            raise ValueError(f"Column '{col}' must not be empty")
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from utils import storage
+
+SKETCH_FILE = "sketches.csv"
+SKETCH_META_FILE = "sketches_meta.json"
+DERIVED = storage.DerivedTable("sketches", SKETCH_META_FILE)
+
+# One sketch per (year, department, criterion) slice and answer field
+SLICE_KEYS = ["evaluation_year", "department", "criteria", "field"]
+FIELDS = ["score", "value"]
+
+# Roughly the number of centroids kept per sketch. Centroids are finer towards the tails,
+# so P90 and the quartiles are accurate to a fraction of a percentile.
+COMPRESSION = 100
+
+QUANTILES = {"min": 0.0, "q1": 0.25, "median": 0.5, "q3": 0.75, "p90": 0.9, "max": 1.0}
+
+
+# A sketch is a list of (mean, weight) centroids, t-digest style, stored as rows of one
+# long table. Sketches merge by concatenating their centroids and compressing again, so
+# slices can be combined across departments and years without touching evaluation rows.
+def compress(centroids, keys, compression=COMPRESSION):
+    """Merge the centroids of each group of keys into at most about `compression` centroids."""
+    centroids = centroids.sort_values(keys + ["mean"], kind="stable")
+    weights = centroids.groupby(keys, dropna=False, sort=False)["weight"]
+    q = (weights.cumsum() - centroids["weight"] / 2) / weights.transform("sum")
+    # Arcsine scale function: equal steps in k are narrow near q=0 and q=1, wide at the median
+    bucket = np.floor(compression * (np.arcsin(2 * q - 1) / np.pi + 0.5))
+    # The smallest and largest centroids are never merged, which keeps min and max exact
+    position = weights.cumcount()
+    bucket = bucket.mask(position == 0, -1).mask(position == weights.transform("size") - 1, compression + 1)
+    merged = (
+        centroids.assign(_bucket=bucket, _mass=centroids["mean"] * centroids["weight"])
+        .groupby(keys + ["_bucket"], dropna=False, sort=False)[["_mass", "weight"]].sum()
+        .reset_index()
+    )
+    return merged.assign(mean=merged["_mass"] / merged["weight"])[keys + ["mean", "weight"]]
+
+
+def _centroids(rows):
+    # Equal answers collapse into one centroid, so small rating scales stay exact
+    parts = [
+        rows.dropna(subset=[field])
+        .groupby(SLICE_KEYS[:-1] + [field], dropna=False).size()
+        .reset_index(name="weight")
+        .rename(columns={field: "mean"})
+        .assign(field=field)
+        for field in FIELDS
+    ]
+    return compress(pd.concat(parts, ignore_index=True), SLICE_KEYS)
+
+
+def _save(data_dir, table, source):
+    storage.replace_file(storage.path(data_dir, SKETCH_FILE), lambda p: table.to_csv(p, index=False))
+    DERIVED.save_meta(data_dir, source)
+
+
+def _build(data_dir):
+    # The sketches of the full evaluation history of the snapshot the thread reads
+    from utils import engine
+
+    if engine.use_parallel(data_dir):
+        # Large histories are sketched range by range in worker processes, then merged
+        return compress(pd.concat(engine.map_rows(data_dir, _centroids, SLICE_KEYS[:-1] + FIELDS),
+                                  ignore_index=True), SLICE_KEYS)
+    return _centroids(storage.load_history(data_dir))
+
+
+def rebuild(data_dir):
+    """Build the sketch table from the full evaluation history, archived years included.
+
+    The caller holds the write lock.
+    """
+    source = storage.evaluation_source(data_dir)
+    table = _build(data_dir)
+    _save(data_dir, table, source)
+    return table
+
+
+def update(data_dir, new_rows, previous_source):
+    """Fold newly submitted rows into the stored sketches; only the touched slices are recompressed.
+
+    previous_source is storage.evaluation_source from before the rows were appended; a table
+    that was already stale is left for `load` to rebuild. The caller holds the write lock.
+    """
+    if not DERIVED.is_current(data_dir, previous_source):
+        return None
+    table = _read_table(data_dir)
+
+    partial = _centroids(new_rows)
+    touched = table.merge(partial[SLICE_KEYS].drop_duplicates().assign(_touched=True), on=SLICE_KEYS, how="left")
+    is_touched = touched["_touched"].notna().to_numpy()
+    refreshed = compress(pd.concat([table[is_touched], partial], ignore_index=True), SLICE_KEYS)
+    table = pd.concat([table[~is_touched], refreshed], ignore_index=True)
+    _save(data_dir, table, storage.evaluation_source(data_dir))
+    return table
+
+
+def _read_table(data_dir):
+    return pd.read_csv(storage.source(data_dir, SKETCH_FILE), dtype={"department": "str", "criteria": "str"})
+
+
+def load(data_dir):
+    """Return the sketch table, rebuilding it if it is missing or stale (judged from metadata).
+
+    Like trends.load, a stale table is served rather than waiting for a writer.
+    """
+    def read(data_dir):
+        paths = [storage.path(data_dir, SKETCH_FILE), storage.path(data_dir, SKETCH_META_FILE)]
+        return storage.cached(data_dir, "sketches", paths, lambda: _read_table(data_dir))
+
+    return DERIVED.load(data_dir, rebuild, _build, read)
+
+
+def quantiles(table, field, keys, years=None, departments=None, criteria=None):
+    """Min, quartiles, P90, max and count of `field` per group of keys, merging the matching slices."""
+    selected = table[table["field"] == field]
+    if years is not None:
+        selected = selected[selected["evaluation_year"].isin(years)]
+    if departments is not None:
+        selected = selected[selected["department"].isin(departments)]
+    if criteria is not None:
+        selected = selected[selected["criteria"].isin(criteria)]
+
+    records = []
+    for key, sketch in compress(selected, keys).groupby(keys, dropna=False, sort=True):
+        weights = sketch["weight"].to_numpy()
+        # Each centroid sits at the middle of the quantile range its weight covers
+        centers = (np.cumsum(weights) - weights / 2) / weights.sum()
+        values = np.interp(list(QUANTILES.values()), centers, sketch["mean"].to_numpy())
+        records.append(dict(zip(keys, key), **dict(zip(QUANTILES, values)), count=int(weights.sum())))
+    return pd.DataFrame(records, columns=keys + list(QUANTILES) + ["count"])
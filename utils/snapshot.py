@@ -0,0 +1,318 @@
+"""Snapshot-consistent reads of a tenant's data files.
+
+Writers publish their changes as a new snapshot instead of letting readers see files
+half way through a write. snapshot.json is the version pointer:
+
+    {"version": 12,
+     "files": {"employee_info.csv": {"version": 9, "bytes": 2048, "stamp": [inode, mtime_ns, size]}, ...},
+     "retired": [[".snapshots/employee_info.csv.7", 1760000000.0], ...]}
+
+Every published version of a data file is a hard link .snapshots/<file>.<version> to
+the file as it was written (files are replaced by write-then-rename, so a link keeps
+that version's content). evaluation_data.csv, the tombstone file and the coverage table
+are appended in place; for them the pointer also records how many bytes are committed, and readers
+never read past that. Files written under storage.write_lock are published together
+when the lock is released, so a submit, an upload or an archive run becomes visible
+all at once. The tables derived from the evaluations (trends, sketches, coverage) and
+their meta files are published too, so a rerun never pairs one version's rows with
+another version's tables.
+
+A page pins the current snapshot when it starts (tenants.current_data_dir) and reads
+that snapshot for the whole rerun, without ever waiting for a writer. Threads that did
+not pin read the latest snapshot, and a thread holding the write lock reads the files
+themselves. Cached datasets are stamped with the version they were read at (see
+storage.cached). Superseded versions are deleted RETAIN_SECONDS after they were
+replaced, long after any rerun that pinned them has finished.
+"""
+import functools
+import io
+import json
+import os
+import shutil
+import threading
+import time
+
+from utils import storage
+from utils.cache import CACHE
+
+SNAPSHOT_FILE = "snapshot.json"
+SNAPSHOT_DIR = ".snapshots"
+RETAIN_SECONDS = 600
+
+_local = threading.local()
+
+
+def published_names():
+    """Data files of a tenant that are read through snapshots, relative to its folder."""
+    from utils import archive, coverage, sketches, tombstones, trends
+
+    return [storage.CONFIG_FILE, storage.EMPLOYEE_FILE, storage.EVALUATION_FILE, storage.DEFAULT_CRITERIA_FILE,
+            storage.CUSTOM_CRITERIA_FILE, tombstones.TOMBSTONE_FILE, f"{archive.ARCHIVE_DIR}/{archive.MANIFEST_FILE}",
+            trends.EMPLOYEE_YOY_FILE, trends.DEPARTMENT_YOY_FILE, trends.YOY_META_FILE,
+            sketches.SKETCH_FILE, sketches.SKETCH_META_FILE, coverage.COVERAGE_FILE, coverage.COVERAGE_META_FILE]
+
+
+def pointer_path(data_dir):
+    return storage.path(data_dir, SNAPSHOT_FILE)
+
+
+def _canonical(data_dir, name):
+    return os.path.join(data_dir, *name.split("/"))
+
+
+def _link_path(data_dir, name, version):
+    return os.path.join(data_dir, SNAPSHOT_DIR, f"{name.replace('/', '__')}.{version}")
+
+
+@functools.lru_cache(maxsize=None)
+def _names_by_path(abs_data_dir):
+    return {os.path.abspath(_canonical(abs_data_dir, name)): name for name in published_names()}
+
+
+def _stat(file_path):
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+class Snapshot:
+    """One published version of a tenant's data files.
+
+    `live` snapshots belong to a thread holding the write lock: they read the files on
+    disk, including changes that are not published yet.
+    """
+
+    def __init__(self, data_dir, pointer, live=False):
+        self.data_dir = data_dir
+        self.version = pointer["version"]
+        self.files = pointer["files"]
+        self.live = live
+
+    def stamp(self, name):
+        entry = self.files.get(name)
+        if self.live:
+            current = _stat(_canonical(self.data_dir, name))
+            if entry is None or current != entry["stamp"]:
+                return ("file", current and tuple(current))
+        return entry and (entry["version"], entry["bytes"])
+
+    def file_stamp(self, name):
+        """[inode, mtime_ns, size] of the file as published in this snapshot, or None if it does not exist."""
+        if self.live:
+            return _stat(_canonical(self.data_dir, name))
+        entry = self.files.get(name)
+        return entry and entry["stamp"]
+
+    def exists(self, name):
+        if self.live:
+            return os.path.exists(_canonical(self.data_dir, name))
+        return name in self.files
+
+    def locate(self, name):
+        """(path, committed bytes) of the file in this snapshot, or None if it does not exist."""
+        if self.live:
+            file_path = _canonical(self.data_dir, name)
+            file_stamp = _stat(file_path)
+            return file_stamp and (file_path, file_stamp[2])
+        entry = self.files.get(name)
+        if entry is None:
+            return None
+        link = _link_path(self.data_dir, name, entry["version"])
+        if not os.path.exists(link):
+            # Deleted RETAIN_SECONDS after being replaced; only a thread that never re-pinned gets here
+            return pin(self.data_dir).locate(name)
+        return link, entry["bytes"]
+
+    def source(self, name):
+        """A binary file object pandas and json can read the file from, or None if it does not exist."""
+        located = self.locate(name)
+        if located is None:
+            return None
+        return io.BufferedReader(_Committed(*located))
+
+
+class _Committed(io.RawIOBase):
+    # The first `size` bytes of a file; rows appended after the snapshot are never read
+    def __init__(self, file_path, size):
+        self._file = open(file_path, "rb")
+        self._size = size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def readinto(self, buffer):
+        n = max(min(len(buffer), self._size - self._file.tell()), 0)
+        data = self._file.read(n)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def _read_pointer(data_dir):
+    file_path = pointer_path(data_dir)
+
+    def loader():
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    if not os.path.exists(file_path):
+        return None
+    return CACHE.get(os.path.abspath(data_dir), "snapshot-pointer", storage.file_stamp(file_path), loader)
+
+
+def _unpublished(data_dir, pointer):
+    # Files changed on disk since the pointer was written: a writer at work, or an edit by hand
+    files = pointer["files"] if pointer else {}
+    for name in published_names():
+        entry = files.get(name)
+        if _stat(_canonical(data_dir, name)) != (entry and entry["stamp"]):
+            return True
+    return False
+
+
+def latest(data_dir):
+    """The most recently published snapshot, or a live one for a thread holding the write lock."""
+    pointer = _read_pointer(data_dir)
+    if storage.holds_write_lock(data_dir):
+        return Snapshot(data_dir, pointer or {"version": 0, "files": {}}, live=True)
+    if _unpublished(data_dir, pointer):
+        # Publish changes made outside the app; if a writer holds the lock it publishes them itself
+        with storage.write_lock(data_dir, blocking=False) as acquired:
+            pass
+        if acquired:
+            pointer = _read_pointer(data_dir)
+    if pointer is None:
+        return Snapshot(data_dir, {"version": 0, "files": {}}, live=True)
+    return Snapshot(data_dir, pointer)
+
+
+def _pins():
+    if not hasattr(_local, "pins"):
+        _local.pins = {}
+    return _local.pins
+
+
+def pin(data_dir):
+    """Read the latest snapshot of data_dir from this thread until the next pin."""
+    snapshot = latest(data_dir)
+    _pins()[os.path.abspath(data_dir)] = snapshot
+    return snapshot
+
+
+def current(data_dir):
+    """The snapshot this thread reads: live under the write lock, else pinned, else the latest."""
+    if storage.holds_write_lock(data_dir):
+        return latest(data_dir)
+    snapshot = _pins().get(os.path.abspath(data_dir))
+    return snapshot if snapshot is not None else latest(data_dir)
+
+
+def is_latest(data_dir):
+    """Whether this thread reads the most recently published snapshot."""
+    snapshot = current(data_dir)
+    pointer = _read_pointer(data_dir)
+    return snapshot.live or pointer is None or snapshot.version == pointer["version"]
+
+
+def stamp(data_dir, files):
+    """Cache stamp of files: snapshot versions for published data files, modification times for others."""
+    snapshot = None
+    names = _names_by_path(os.path.abspath(data_dir))
+    stamps = []
+    for file_path in files:
+        name = names.get(os.path.abspath(file_path))
+        if name is None:
+            stamps.append(storage.file_stamp(file_path)[0])
+            continue
+        snapshot = snapshot or current(data_dir)
+        stamps.append(snapshot.stamp(name))
+    return tuple(stamps)
+
+
+def retire(data_dir, file_path):
+    """Delete a file no longer referenced by new snapshots once older snapshots are done with it.
+
+    The caller holds the write lock; the file is recorded with the next publish.
+    """
+    if not hasattr(_local, "retired"):
+        _local.retired = {}
+    _local.retired.setdefault(os.path.abspath(data_dir), []).append(os.path.relpath(file_path, data_dir))
+
+
+def _link(source, target):
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        # File systems without hard links get a copy
+        shutil.copyfile(source, target)
+
+
+def _write_pointer(file_path, pointer):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+
+
+def publish(data_dir):
+    """Publish every data file changed on disk as one new snapshot; the caller holds the write lock."""
+    file_path = pointer_path(data_dir)
+    pointer = None
+    if os.path.exists(file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+    pointer = pointer or {"version": 0, "files": {}, "retired": []}
+    version = pointer["version"] + 1
+    now = time.time()
+    retired = [[p, now] for p in getattr(_local, "retired", {}).pop(os.path.abspath(data_dir), [])]
+
+    changed = False
+    for name in published_names():
+        current_stamp = _stat(_canonical(data_dir, name))
+        entry = pointer["files"].get(name)
+        if current_stamp == (entry and entry["stamp"]):
+            continue
+        changed = True
+        if current_stamp is None:
+            del pointer["files"][name]
+            retired.append([os.path.relpath(_link_path(data_dir, name, entry["version"]), data_dir), now])
+        elif entry is not None and current_stamp[0] == entry["stamp"][0] and current_stamp[2] >= entry["bytes"]:
+            # Appended in place: older snapshots keep reading their committed bytes of the same file
+            entry.update(bytes=current_stamp[2], stamp=current_stamp)
+        else:
+            os.makedirs(storage.path(data_dir, SNAPSHOT_DIR), exist_ok=True)
+            _link(_canonical(data_dir, name), _link_path(data_dir, name, version))
+            if entry is not None:
+                retired.append([os.path.relpath(_link_path(data_dir, name, entry["version"]), data_dir), now])
+            pointer["files"][name] = {"version": version, "bytes": current_stamp[2], "stamp": current_stamp}
+    if not changed and not retired:
+        return pointer
+
+    keep = []
+    for relative_path, retired_at in pointer.get("retired", []) + retired:
+        if now - retired_at < RETAIN_SECONDS:
+            keep.append([relative_path, retired_at])
+        elif os.path.exists(os.path.join(data_dir, relative_path)):
+            os.remove(os.path.join(data_dir, relative_path))
+    pointer.update(version=version if changed else pointer["version"], retired=keep)
+    storage.replace_file(file_path, lambda p: _write_pointer(p, pointer))
+
+    # A thread reads its own writes for the rest of its rerun
+    pins = _pins()
+    if os.path.abspath(data_dir) in pins:
+        pins[os.path.abspath(data_dir)] = Snapshot(data_dir, pointer)
+    return pointer
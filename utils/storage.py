@@ -0,0 +1,551 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import pandas as pd
+
+from utils import schema
+from utils.cache import CACHE
+
+CONFIG_FILE = "config.json"
+EMPLOYEE_FILE = "employee_info.csv"
+EVALUATION_FILE = "evaluation_data.csv"
+DEFAULT_CRITERIA_FILE = "criteria_config.csv"
+CUSTOM_CRITERIA_FILE = "custom_criteria.csv"
+WRITE_LOCK_FILE = ".write.lock"
+
+# Tenants without their own default criteria use the app-wide one
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_migration_lock = threading.Lock()
+_write_lock = threading.Lock()
+_lock_state = threading.local()
+_rebuilding = set()
+_rebuilding_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def path(data_dir, name):
+    return os.path.join(data_dir, name)
+
+
+def file_stamp(*paths):
+    """Modification time and size of each file, used to detect changes on disk."""
+    stamp = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def dataset_files(data_dir):
+    """Files whose contents determine every dashboard aggregate of a tenant."""
+    from utils import archive, tombstones
+
+    files = [path(data_dir, name) for name in (CONFIG_FILE, EMPLOYEE_FILE, EVALUATION_FILE,
+                                               DEFAULT_CRITERIA_FILE, CUSTOM_CRITERIA_FILE)]
+    return files + [path(APP_DIR, DEFAULT_CRITERIA_FILE), archive.manifest_path(data_dir),
+                    tombstones.tombstone_path(data_dir)]
+
+
+def dataset_version(data_dir):
+    """Short fingerprint that changes whenever any of the tenant's data files change."""
+    from utils import snapshot
+
+    return hashlib.sha1(repr(snapshot.stamp(data_dir, dataset_files(data_dir))).encode()).hexdigest()[:16]
+
+
+def cached(data_dir, name, files, loader):
+    """Load through the process-wide tenant cache, reloading when any of files change.
+
+    Data files are stamped with their version in the snapshot the thread reads, so a
+    value cached for one snapshot is never served to a rerun pinned to another.
+    """
+    from utils import snapshot
+
+    return CACHE.get(os.path.abspath(data_dir), name, snapshot.stamp(data_dir, files), loader)
+
+
+def source(data_dir, name):
+    """Where to read the tenant's data file `name` in the snapshot the thread reads, or None if it does not exist."""
+    from utils import snapshot
+
+    return snapshot.current(data_dir).source(name)
+
+
+def replace_file(file_path, write):
+    """Call write(tmp_path), then rename the result over file_path so readers never see a partial file."""
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _held_locks():
+    if not hasattr(_lock_state, "held"):
+        _lock_state.held = {}
+    return _lock_state.held
+
+
+def holds_write_lock(data_dir):
+    return _held_locks().get(os.path.abspath(data_dir), 0) > 0
+
+
+@contextlib.contextmanager
+def _acquire(data_dir, blocking):
+    if fcntl is None:
+        # Without flock writers are only serialized within this process
+        acquired = _write_lock.acquire(blocking=blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _write_lock.release()
+        return
+    with open(path(data_dir, WRITE_LOCK_FILE), "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def write_lock(data_dir, blocking=True):
+    """Serialize read-modify-write updates of one tenant's files across threads and server processes.
+
+    The lock is re-entrant within a thread. Data files changed while it is held are
+    published as one new snapshot when the outermost lock is released (see
+    utils/snapshot.py). With blocking=False the context yields whether the lock was taken.
+    """
+    from utils import snapshot
+
+    held = _held_locks()
+    key = os.path.abspath(data_dir)
+    if held.get(key):
+        held[key] += 1
+        try:
+            yield True
+        finally:
+            held[key] -= 1
+        return
+    with _acquire(data_dir, blocking) as acquired:
+        if not acquired:
+            yield False
+            return
+        held[key] = 1
+        try:
+            yield True
+        finally:
+            try:
+                snapshot.publish(data_dir)
+            finally:
+                del held[key]
+
+
+def read_table(file_path, table_schema):
+    """Read a CSV written by this module; files from older versions are normalized on the fly."""
+    try:
+        return pd.read_csv(file_path, dtype=schema.read_dtypes(table_schema))
+    except (ValueError, TypeError):
+        if hasattr(file_path, "seek"):
+            file_path.seek(0)
+        return schema.normalize(pd.read_csv(file_path), table_schema)
+
+
+def write_table(df, file_path, table_schema):
+    """Normalize and validate df against the schema, then write it."""
+    df = schema.normalize(df, table_schema)
+    schema.validate(df, table_schema)
+    replace_file(file_path, lambda tmp_path: df.to_csv(tmp_path, index=False))
+    return df
+
+
+def empty_table(table_schema):
+    return schema.normalize(pd.DataFrame(columns=list(table_schema)), table_schema)
+
+
+def ensure_schema(data_dir):
+    """Normalize the tenant's files once and record the schema version in its config."""
+    if load_config(data_dir).get(schema.SCHEMA_VERSION_KEY) == schema.SCHEMA_VERSION:
+        return
+    with _migration_lock, write_lock(data_dir):
+        config = load_config(data_dir)
+        if config.get(schema.SCHEMA_VERSION_KEY) == schema.SCHEMA_VERSION:
+            return
+        default_criteria = path(data_dir, DEFAULT_CRITERIA_FILE)
+        if not os.path.exists(default_criteria) and os.path.exists(path(APP_DIR, DEFAULT_CRITERIA_FILE)):
+            shutil.copyfile(path(APP_DIR, DEFAULT_CRITERIA_FILE), default_criteria)
+        for name, table_schema in ((EMPLOYEE_FILE, schema.EMPLOYEE_SCHEMA),
+                                   (EVALUATION_FILE, schema.EVALUATION_SCHEMA),
+                                   (DEFAULT_CRITERIA_FILE, schema.CRITERIA_SCHEMA),
+                                   (CUSTOM_CRITERIA_FILE, schema.CRITERIA_SCHEMA)):
+            file_path = path(data_dir, name)
+            if os.path.exists(file_path):
+                write_table(pd.read_csv(file_path), file_path, table_schema)
+        backfill_departments(data_dir)
+        config[schema.SCHEMA_VERSION_KEY] = schema.SCHEMA_VERSION
+        save_config(data_dir, config)
+
+
+# Config
+def read_json(file_source):
+    if hasattr(file_source, "read"):
+        return json.load(file_source)
+    with open(file_source, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_config(data_dir):
+    config_source = source(data_dir, CONFIG_FILE)
+    if config_source is None:
+        default_config = {"use_custom": False}
+        save_config(data_dir, default_config)
+        return default_config
+    return read_json(config_source)
+
+
+def _write_json(file_path, value):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+
+def save_config(data_dir, config):
+    config_path = path(data_dir, CONFIG_FILE)
+    with write_lock(data_dir):
+        # Skip unchanged saves so cached aggregates keyed on the file stay valid
+        if os.path.exists(config_path) and read_json(config_path) == config:
+            return
+        replace_file(config_path, lambda p: _write_json(p, config))
+
+
+def _load_live(data_dir, name, file_path, table_schema, hidden_ids):
+    # One cached frame per version of the file and of the tombstones, already without the
+    # rows of hidden_ids, rather than the parsed rows and a filtered copy next to them
+    from utils import tombstones
+
+    def loader():
+        file_source = source(data_dir, os.path.basename(file_path))
+        if file_source is None:
+            return empty_table(table_schema)
+        return tombstones.without(read_table(file_source, table_schema), hidden_ids)
+
+    if not hidden_ids:
+        return cached(data_dir, name, [file_path], loader)
+    return cached(data_dir, name, [file_path, tombstones.tombstone_path(data_dir)], loader)
+
+
+# Employees
+def load_employees(data_dir):
+    """Employees, without the deleted ones."""
+    from utils import tombstones
+
+    # Every deleted id, compacted or not: an employee list saved again with them keeps them hidden
+    return _load_live(data_dir, "employees", path(data_dir, EMPLOYEE_FILE), schema.EMPLOYEE_SCHEMA,
+                      tombstones.deleted_ids(data_dir))
+
+
+def save_employees(data_dir, employee_df):
+    with write_lock(data_dir):
+        write_table(employee_df, path(data_dir, EMPLOYEE_FILE), schema.EMPLOYEE_SCHEMA)
+
+
+# Evaluations
+def evaluations_exist(data_dir):
+    from utils import snapshot
+
+    return snapshot.current(data_dir).exists(EVALUATION_FILE)
+
+
+def load_evaluations(data_dir, years=None):
+    """Evaluation rows of the open (not archived) years, or of the given years including archived ones.
+
+    Rows of deleted employees are left out.
+    """
+    from utils import archive, tombstones
+
+    # Compaction has already taken out the rows of the other deleted employees
+    eval_df = _load_live(data_dir, "evaluations", path(data_dir, EVALUATION_FILE), schema.EVALUATION_SCHEMA,
+                         tombstones.pending_ids(data_dir))
+    if years is None:
+        return eval_df
+
+    years = set(years)
+    archived = [year for year in archive.archived_years(data_dir) if year in years]
+    selected = eval_df[eval_df["evaluation_year"].isin(list(years))]
+    if not archived:
+        return selected
+    return pd.concat([selected] + [archive.load_year(data_dir, year) for year in archived], ignore_index=True)
+
+
+def evaluation_years(data_dir):
+    """All years with evaluations, open and archived."""
+    from utils import archive, engine, tombstones
+
+    def loader():
+        if engine.use_parallel(data_dir, include_archived=False):
+            # Counted in worker processes instead of loading every row
+            stats = engine.group_stats(data_dir, ["evaluation_year"], "evaluation_year", include_archived=False)
+            return set(stats["evaluation_year"].astype(int).tolist())
+        return set(load_evaluations(data_dir)["evaluation_year"].unique().tolist())
+
+    files = [path(data_dir, EVALUATION_FILE), tombstones.tombstone_path(data_dir)]
+    open_years = cached(data_dir, "evaluation_years", files, loader)
+    return sorted(open_years | set(archive.archived_years(data_dir)))
+
+
+def evaluation_source(data_dir):
+    """What the tables derived from evaluation rows (trends, sketches, coverage) are built from.
+
+    The evaluation file and archive manifest as published in the snapshot the thread
+    reads, and the tombstones (see tombstones.fingerprint). The tables record it in their
+    meta files and are stale once it differs, so checking them never reads evaluation rows.
+    """
+    from utils import archive, snapshot, tombstones
+
+    tenant_snapshot = snapshot.current(data_dir)
+    return {"evaluations": tenant_snapshot.file_stamp(EVALUATION_FILE),
+            "archive": tenant_snapshot.file_stamp(f"{archive.ARCHIVE_DIR}/{archive.MANIFEST_FILE}"),
+            "deleted": tombstones.fingerprint(data_dir)}
+
+
+def load_history(data_dir):
+    """Evaluation rows of every year, open and archived, for building derived tables in memory."""
+    from utils import archive
+
+    eval_df = load_evaluations(data_dir)
+    years = archive.archived_years(data_dir)
+    if not years:
+        return eval_df
+    return pd.concat([eval_df] + [archive.load_year(data_dir, year) for year in years], ignore_index=True)
+
+
+class DerivedTable:
+    """Meta file of a table derived from evaluation rows (trends, sketches, coverage).
+
+    The meta file records the evaluation_source the table accounts for; the table is
+    current while that matches the snapshot the thread reads.
+    """
+
+    def __init__(self, name, meta_file):
+        self.name = name
+        self.meta_file = meta_file
+
+    def built_from(self, data_dir):
+        """The evaluation_source recorded for the table, or None if it was never built."""
+        meta_source = source(data_dir, self.meta_file)
+        if meta_source is None:
+            return None
+        with meta_source:
+            return json.load(meta_source).get("source")
+
+    def save_meta(self, data_dir, built_from):
+        replace_file(path(data_dir, self.meta_file), lambda p: _write_json(p, {"source": built_from}))
+
+    def is_current(self, data_dir, against=None):
+        """Whether the table accounts for `against`, by default the current evaluation_source."""
+        built_from = self.built_from(data_dir)
+        return built_from is not None and built_from == (against or evaluation_source(data_dir))
+
+    def carry_over(self, data_dir, previous_source):
+        """Record the table as current after a write that moved rows without changing what it counts.
+
+        Only a table that was current at previous_source; see carry_over_derived.
+        """
+        if self.is_current(data_dir, previous_source):
+            self.save_meta(data_dir, evaluation_source(data_dir))
+
+    def load(self, data_dir, rebuild, build, read):
+        """read(data_dir), after rebuilding the table if it is missing or stale.
+
+        A stale table is served rather than waiting for a writer (see rebuild_stale), and
+        with nothing published yet, build(data_dir) makes it from this rerun's snapshot.
+        """
+        from utils import snapshot
+
+        if not self.is_current(data_dir):
+            rebuilt = rebuild_stale(data_dir, self.name, self.is_current, rebuild)
+            if rebuilt is not None:
+                return rebuilt
+            if not snapshot.current(data_dir).exists(self.meta_file):
+                return build(data_dir)
+        return read(data_dir)
+
+
+def _derived_tables():
+    # (meta, rebuild) of each table derived from evaluation rows
+    from utils import coverage, sketches, trends
+
+    return [(trends.DERIVED, trends.rebuild), (sketches.DERIVED, sketches.rebuild),
+            (coverage.DERIVED, coverage.rebuild)]
+
+
+def _run_rebuild(data_dir, key, is_current, rebuild):
+    try:
+        with write_lock(data_dir):
+            if not is_current(data_dir):
+                rebuild(data_dir)
+    except Exception:
+        # The table stays stale and the next reader that notices starts another rebuild
+        logger.exception("Rebuilding %s failed in %s", key[1], data_dir)
+    finally:
+        with _rebuilding_lock:
+            _rebuilding.discard(key)
+
+
+def rebuild_stale(data_dir, name, is_current, rebuild):
+    """Rebuild a stale derived table without ever waiting for a writer.
+
+    When this thread reads the latest snapshot and the write lock is free, the table is
+    rebuilt right away and returned. Otherwise None is returned and the caller serves the
+    version in its snapshot, while a background thread (one per table) waits for the lock
+    and rebuilds the table unless it has become current by then.
+    """
+    from utils import snapshot
+
+    if snapshot.is_latest(data_dir):
+        with write_lock(data_dir, blocking=False) as acquired:
+            if acquired and not is_current(data_dir):
+                return rebuild(data_dir)
+        if acquired:
+            return None
+    key = (os.path.abspath(data_dir), name)
+    with _rebuilding_lock:
+        if key in _rebuilding:
+            return None
+        _rebuilding.add(key)
+    threading.Thread(target=_run_rebuild, args=(data_dir, key, is_current, rebuild),
+                     name=f"perf-track-rebuild-{name}", daemon=True).start()
+    return None
+
+
+def rebuild_derived(data_dir):
+    """Rebuild the stale derived tables built so far, off the request path of the write that made them stale.
+
+    Readers in the meantime go through rebuild_stale and never wait for this.
+    """
+    with write_lock(data_dir):
+        for table, rebuild in _derived_tables():
+            if os.path.exists(path(data_dir, table.meta_file)) and not table.is_current(data_dir):
+                rebuild(data_dir)
+
+
+def carry_over_derived(data_dir, previous_source):
+    """Keep derived tables current across a write that moves rows without changing what they count.
+
+    Archiving and compaction rewrite the files evaluation_source stamps; tables that were
+    current at previous_source are recorded as current for the new files. The caller holds
+    the write lock.
+    """
+    for table, _ in _derived_tables():
+        table.carry_over(data_dir, previous_source)
+
+
+def backfill_departments(data_dir):
+    """Fill in the department of evaluation rows written before it was stored with them.
+
+    Rows from before schema version 2 get the employee's current department, since
+    earlier transfers were not recorded. Rows that already have one are left alone.
+    Returns the number of rows filled in.
+    """
+    evaluation_path = path(data_dir, EVALUATION_FILE)
+    employee_path = path(data_dir, EMPLOYEE_FILE)
+    if not os.path.exists(evaluation_path) or not os.path.exists(employee_path):
+        return 0
+    eval_df = read_table(evaluation_path, schema.EVALUATION_SCHEMA)
+    missing = eval_df["department"].isna()
+    if not missing.any():
+        return 0
+    employee_df = read_table(employee_path, schema.EMPLOYEE_SCHEMA)
+    current = employee_df.drop_duplicates("employee_id", keep="last").set_index("employee_id")["department"]
+    eval_df.loc[missing, "department"] = eval_df.loc[missing, "employee_id"].map(current)
+    write_table(eval_df, evaluation_path, schema.EVALUATION_SCHEMA)
+    return int(eval_df.loc[missing, "department"].notna().sum())
+
+
+def append_evaluations(data_dir, new_data):
+    from utils import archive, coverage, sketches, trends
+
+    new_data = schema.normalize(new_data, schema.EVALUATION_SCHEMA)
+    schema.validate(new_data, schema.EVALUATION_SCHEMA)
+    closed = set(new_data["evaluation_year"]) & set(archive.archived_years(data_dir))
+    if closed:
+        raise ValueError(f"Evaluation year {', '.join(map(str, sorted(closed)))} is closed and archived")
+    evaluation_path = path(data_dir, EVALUATION_FILE)
+    # The derived tables are read, updated and rewritten, so concurrent submits take turns
+    with write_lock(data_dir):
+        source_before = evaluation_source(data_dir)
+        if evaluations_exist(data_dir):
+            # Rows are already normalized, so append them in the file's column order instead of rewriting it
+            header = pd.read_csv(evaluation_path, nrows=0).columns
+            new_data.reindex(columns=header).to_csv(evaluation_path, mode="a", header=False, index=False)
+        else:
+            new_data.to_csv(evaluation_path, index=False)
+        trends.update(data_dir, new_data, source_before)
+        sketches.update(data_dir, new_data, source_before)
+        coverage.update(data_dir, new_data, source_before)
+
+
+# Criteria
+def criteria_path(data_dir, use_custom):
+    """Path of the criteria file in use, or None when there is none."""
+    from utils import snapshot
+
+    tenant_snapshot = snapshot.current(data_dir)
+    if use_custom and tenant_snapshot.exists(CUSTOM_CRITERIA_FILE):
+        return path(data_dir, CUSTOM_CRITERIA_FILE)
+    if tenant_snapshot.exists(DEFAULT_CRITERIA_FILE):
+        return path(data_dir, DEFAULT_CRITERIA_FILE)
+    if os.path.exists(path(APP_DIR, DEFAULT_CRITERIA_FILE)):
+        return path(APP_DIR, DEFAULT_CRITERIA_FILE)
+    return None
+
+
+def _read_criteria(data_dir, criteria_file):
+    # The tenant's own criteria files are read from the snapshot, the app-wide default directly
+    if os.path.abspath(os.path.dirname(criteria_file)) == os.path.abspath(data_dir):
+        criteria_file = source(data_dir, os.path.basename(criteria_file))
+    return read_table(criteria_file, schema.CRITERIA_SCHEMA)
+
+
+def load_criteria(data_dir, use_custom):
+    criteria_file = criteria_path(data_dir, use_custom)
+    if criteria_file is None:
+        return None
+    return cached(data_dir, "criteria:" + criteria_file, [criteria_file],
+                  lambda: _read_criteria(data_dir, criteria_file))
+
+
+def load_custom_criteria(data_dir):
+    from utils import snapshot
+
+    if not snapshot.current(data_dir).exists(CUSTOM_CRITERIA_FILE):
+        return None
+    custom_path = path(data_dir, CUSTOM_CRITERIA_FILE)
+    return cached(data_dir, "criteria:" + custom_path, [custom_path],
+                  lambda: _read_criteria(data_dir, custom_path))
+
+
+def save_custom_criteria(data_dir, criteria_df):
+    with write_lock(data_dir):
+        write_table(criteria_df, path(data_dir, CUSTOM_CRITERIA_FILE), schema.CRITERIA_SCHEMA)
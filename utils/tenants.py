@@ -0,0 +1,61 @@
+import os
+import re
+
+import streamlit as st
+
+from utils import snapshot, storage
+from utils.storage import APP_DIR
+
+# Each tenant keeps its data files in tenants/<name>/; the default tenant uses the app folder
+TENANTS_DIR = os.path.join(APP_DIR, "tenants")
+DEFAULT_TENANT = "default"
+TENANT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def list_tenants():
+    names = []
+    if os.path.isdir(TENANTS_DIR):
+        names = sorted(
+            name for name in os.listdir(TENANTS_DIR)
+            if TENANT_NAME_PATTERN.match(name) and name != DEFAULT_TENANT
+            and os.path.isdir(os.path.join(TENANTS_DIR, name))
+        )
+    return [DEFAULT_TENANT] + names
+
+
+def tenant_dir(tenant):
+    if tenant == DEFAULT_TENANT:
+        return "."
+    if not TENANT_NAME_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant name: {tenant!r}")
+    return os.path.join(TENANTS_DIR, tenant)
+
+
+def _sync_query_param():
+    st.query_params["tenant"] = st.session_state["tenant_selector"]
+
+
+def current_data_dir():
+    """Resolve the tenant from the ?tenant= URL parameter or the sidebar selector."""
+    names = list_tenants()
+
+    requested = st.query_params.get("tenant")
+    if requested is not None:
+        if requested not in names:
+            st.error(f"❌ Unknown tenant '{requested}'. / ไม่พบข้อมูลของบริษัท '{requested}'")
+            st.stop()
+        tenant = requested
+    else:
+        tenant = st.session_state.get("tenant", DEFAULT_TENANT)
+        if tenant not in names:
+            tenant = DEFAULT_TENANT
+
+    if len(names) > 1:
+        st.session_state["tenant_selector"] = tenant
+        tenant = st.sidebar.selectbox("Company / บริษัท", names, key="tenant_selector", on_change=_sync_query_param)
+    st.session_state["tenant"] = tenant
+    data_dir = tenant_dir(tenant)
+    storage.ensure_schema(data_dir)
+    # Everything the page reads during this rerun comes from one snapshot of the tenant's files
+    snapshot.pin(data_dir)
+    return data_dir
@@ -0,0 +1,287 @@
+"""Soft deletes of employees.
+
+Deleting an employee only appends a line to deleted_employees.csv, so it takes the same
+time however large the data files are. The loaders in storage and archive drop the rows
+of tombstoned employees that are not compacted yet, their evaluations included, so
+dashboards stop counting them right away. Compaction later rewrites employee_info.csv, evaluation_data.csv and the
+archive partitions without those rows, in a background thread after each delete, and
+keeps the removed rows under deleted/ so the employee can still be restored.
+
+Command line, from the app folder:
+
+    python -m utils.tombstones --list [--tenant acme]
+    python -m utils.tombstones --compact [--tenant acme]
+    python -m utils.tombstones --restore E00042 [--tenant acme]
+"""
+import argparse
+import datetime
+import hashlib
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from utils import schema, storage
+
+TOMBSTONE_FILE = "deleted_employees.csv"
+TOMBSTONE_COLUMNS = ["employee_id", "name", "department", "deleted_at", "compacted"]
+# Rows taken out of the data files by compaction, kept for restores
+DELETED_DIR = "deleted"
+DELETED_EMPLOYEES_FILE = "employees.csv"
+DELETED_EVALUATIONS_FILE = "evaluations.csv"
+
+_compacting = set()
+_compacting_lock = threading.Lock()
+# Last failure of a background compaction per tenant, until a later pass succeeds
+_compaction_errors = {}
+
+logger = logging.getLogger(__name__)
+
+
+def tombstone_path(data_dir):
+    return storage.path(data_dir, TOMBSTONE_FILE)
+
+
+def _deleted_path(data_dir, name):
+    return os.path.join(storage.path(data_dir, DELETED_DIR), name)
+
+
+def _read_tombstones(file_path):
+    tombstones = pd.read_csv(file_path, dtype={"employee_id": "str", "name": "str", "department": "str"})
+    return tombstones.assign(compacted=tombstones["compacted"].astype(bool))
+
+
+def load(data_dir):
+    """One row per deleted employee, with the name and department they had when deleted."""
+    def loader():
+        file_source = storage.source(data_dir, TOMBSTONE_FILE)
+        if file_source is not None:
+            return _read_tombstones(file_source)
+        return pd.DataFrame(columns=TOMBSTONE_COLUMNS)
+
+    return storage.cached(data_dir, "tombstones", [tombstone_path(data_dir)], loader)
+
+
+def deleted_ids(data_dir):
+    return storage.cached(data_dir, "tombstone-ids", [tombstone_path(data_dir)],
+                          lambda: frozenset(load(data_dir)["employee_id"]))
+
+
+def pending_ids(data_dir):
+    """Deleted employees whose rows are still in the data files; compaction took the others' out."""
+    def loader():
+        tombstones = load(data_dir)
+        return frozenset(tombstones.loc[~tombstones["compacted"], "employee_id"])
+
+    return storage.cached(data_dir, "tombstone-pending-ids", [tombstone_path(data_dir)], loader)
+
+
+def pending(data_dir):
+    """Whether some deleted employees' rows are still in the data files."""
+    return bool(pending_ids(data_dir))
+
+
+def fingerprint(data_dir):
+    """Short fingerprint of the set of deleted employees, None when there are none."""
+    ids = deleted_ids(data_dir)
+    if not ids:
+        return None
+    return hashlib.sha1("\n".join(sorted(ids)).encode()).hexdigest()[:16]
+
+
+def without(df, employee_ids):
+    """df without the rows of the given employees; df itself when there are none."""
+    if not employee_ids:
+        return df
+    return df[~df["employee_id"].isin(employee_ids)].reset_index(drop=True)
+
+
+def _save(data_dir, tombstones):
+    storage.replace_file(tombstone_path(data_dir), lambda p: tombstones.to_csv(p, index=False))
+
+
+def delete_employee(data_dir, employee_id, name=None, department=None):
+    """Record a tombstone for the employee and start compaction; False if already deleted."""
+    file_path = tombstone_path(data_dir)
+    with storage.write_lock(data_dir):
+        if os.path.exists(file_path) and employee_id in set(_read_tombstones(file_path)["employee_id"]):
+            return False
+        tombstone = pd.DataFrame([{
+            "employee_id": employee_id,
+            "name": name,
+            "department": department,
+            "deleted_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "compacted": False,
+        }], columns=TOMBSTONE_COLUMNS)
+        tombstone.to_csv(file_path, mode="a", header=not os.path.exists(file_path), index=False)
+    compact_in_background(data_dir)
+    return True
+
+
+def _read_if_exists(file_path, table_schema):
+    if os.path.exists(file_path):
+        return storage.read_table(file_path, table_schema)
+    return storage.empty_table(table_schema)
+
+
+def _read_deleted(data_dir, name, table_schema):
+    return _read_if_exists(_deleted_path(data_dir, name), table_schema)
+
+
+def _keep_deleted(data_dir, name, table_schema, rows):
+    if rows.empty:
+        return
+    os.makedirs(storage.path(data_dir, DELETED_DIR), exist_ok=True)
+    # A compaction interrupted before marking its tombstones moves the same rows again
+    kept = pd.concat([_read_deleted(data_dir, name, table_schema), rows], ignore_index=True).drop_duplicates()
+    storage.write_table(kept, _deleted_path(data_dir, name), table_schema)
+
+
+def _take_out(file_path, table_schema, employee_ids):
+    # Rewrite file_path without the employees' rows and return those rows
+    rows = _read_if_exists(file_path, table_schema)
+    matches = rows["employee_id"].isin(employee_ids)
+    if matches.any():
+        storage.write_table(rows[~matches], file_path, table_schema)
+    return rows[matches]
+
+
+def compact(data_dir):
+    """Physically remove the rows of deleted employees from the data files; returns the rows removed."""
+    from utils import archive
+
+    with storage.write_lock(data_dir):
+        file_path = tombstone_path(data_dir)
+        if not os.path.exists(file_path):
+            return 0
+        tombstones = _read_tombstones(file_path)
+        employee_ids = set(tombstones.loc[~tombstones["compacted"], "employee_id"])
+        if not employee_ids:
+            return 0
+        source_before = storage.evaluation_source(data_dir)
+
+        # Removed rows are kept before the files are rewritten, so a crash loses nothing
+        employee_path = storage.path(data_dir, storage.EMPLOYEE_FILE)
+        evaluation_path = storage.path(data_dir, storage.EVALUATION_FILE)
+        employees = _read_if_exists(employee_path, schema.EMPLOYEE_SCHEMA)
+        manifest = archive.load_manifest(data_dir)
+        evaluations = pd.concat([_read_if_exists(evaluation_path, schema.EVALUATION_SCHEMA)]
+                                + [archive._load_partition(data_dir, year, manifest) for year in manifest["years"]],
+                                ignore_index=True)
+        _keep_deleted(data_dir, DELETED_EMPLOYEES_FILE, schema.EMPLOYEE_SCHEMA,
+                      employees[employees["employee_id"].isin(employee_ids)])
+        _keep_deleted(data_dir, DELETED_EVALUATIONS_FILE, schema.EVALUATION_SCHEMA,
+                      evaluations[evaluations["employee_id"].isin(employee_ids)])
+
+        removed = len(_take_out(employee_path, schema.EMPLOYEE_SCHEMA, employee_ids))
+        removed += len(_take_out(evaluation_path, schema.EVALUATION_SCHEMA, employee_ids))
+        removed += len(archive.remove_employee_rows(data_dir, employee_ids))
+
+        tombstones.loc[tombstones["employee_id"].isin(employee_ids), "compacted"] = True
+        _save(data_dir, tombstones)
+        # The derived tables already leave the removed rows out
+        storage.carry_over_derived(data_dir, source_before)
+        return removed
+
+
+def _run_compaction(data_dir, key):
+    try:
+        # Deletes made while a pass runs are left for another pass
+        while pending(data_dir):
+            compact(data_dir)
+        # Rebuilt here rather than in the delete, which stays a single append
+        storage.rebuild_derived(data_dir)
+        _compaction_errors.pop(key, None)
+    except Exception as e:
+        # The rows stay filtered out and the next delete tries again; Admin shows the failure
+        logger.exception("Compaction of deleted employees failed in %s", data_dir)
+        _compaction_errors[key] = f"{datetime.datetime.now().isoformat(timespec='seconds')}: {type(e).__name__}: {e}"
+    finally:
+        with _compacting_lock:
+            _compacting.discard(key)
+
+
+def compact_in_background(data_dir):
+    """Run `compact` in a daemon thread unless one is already running for the tenant."""
+    key = os.path.abspath(data_dir)
+    with _compacting_lock:
+        if key in _compacting:
+            return
+        _compacting.add(key)
+    threading.Thread(target=_run_compaction, args=(data_dir, key), name="perf-track-compaction", daemon=True).start()
+
+
+def compaction_error(data_dir):
+    """Message of the last failed background compaction in this process, or None."""
+    return _compaction_errors.get(os.path.abspath(data_dir))
+
+
+def restore_employee(data_dir, employee_id):
+    """Bring a deleted employee and their evaluations back; False if they are not deleted."""
+    from utils import archive
+
+    with storage.write_lock(data_dir):
+        file_path = tombstone_path(data_dir)
+        tombstones = _read_tombstones(file_path) if os.path.exists(file_path) else pd.DataFrame(columns=TOMBSTONE_COLUMNS)
+        matches = tombstones["employee_id"] == employee_id
+        if not matches.any():
+            return False
+
+        employee_path = storage.path(data_dir, storage.EMPLOYEE_FILE)
+        # The employee list may have been saved without the row since the delete; the tombstone keeps a copy
+        employee_rows = tombstones.loc[matches, ["employee_id", "name", "department"]]
+        if tombstones.loc[matches, "compacted"].any():
+            evaluation_path = storage.path(data_dir, storage.EVALUATION_FILE)
+            kept_employees = _read_deleted(data_dir, DELETED_EMPLOYEES_FILE, schema.EMPLOYEE_SCHEMA)
+            kept_evaluations = _read_deleted(data_dir, DELETED_EVALUATIONS_FILE, schema.EVALUATION_SCHEMA)
+            if (kept_employees["employee_id"] == employee_id).any():
+                employee_rows = kept_employees[kept_employees["employee_id"] == employee_id]
+            evaluation_rows = kept_evaluations[kept_evaluations["employee_id"] == employee_id]
+
+            open_rows = archive.add_rows(data_dir, evaluation_rows)
+            if not open_rows.empty:
+                evaluations = _read_if_exists(evaluation_path, schema.EVALUATION_SCHEMA)
+                storage.write_table(pd.concat([evaluations, open_rows], ignore_index=True), evaluation_path,
+                                    schema.EVALUATION_SCHEMA)
+            storage.write_table(kept_employees[kept_employees["employee_id"] != employee_id],
+                                _deleted_path(data_dir, DELETED_EMPLOYEES_FILE), schema.EMPLOYEE_SCHEMA)
+            storage.write_table(kept_evaluations[kept_evaluations["employee_id"] != employee_id],
+                                _deleted_path(data_dir, DELETED_EVALUATIONS_FILE), schema.EVALUATION_SCHEMA)
+
+        employees = _read_if_exists(employee_path, schema.EMPLOYEE_SCHEMA)
+        # An id added again while deleted keeps that newer row rather than getting a duplicate
+        if not (employees["employee_id"] == employee_id).any():
+            storage.write_table(pd.concat([employees, employee_rows.drop_duplicates("employee_id", keep="last")],
+                                          ignore_index=True), employee_path, schema.EMPLOYEE_SCHEMA)
+
+        # The derived tables are now stale and rebuilt by their next reader (storage.rebuild_stale)
+        _save(data_dir, tombstones[~matches])
+        return True
+
+
+def main():
+    from utils import tenants
+
+    parser = argparse.ArgumentParser(description="List, compact or restore deleted employees.")
+    parser.add_argument("--tenant", default=tenants.DEFAULT_TENANT)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--compact", action="store_true", help="remove deleted employees' rows from the data files")
+    group.add_argument("--restore", nargs="+", metavar="EMPLOYEE_ID", help="deleted employees to bring back")
+    group.add_argument("--list", action="store_true", help="show deleted employees")
+    args = parser.parse_args()
+
+    data_dir = tenants.tenant_dir(args.tenant)
+    storage.ensure_schema(data_dir)
+    if args.compact:
+        print(f"Removed {compact(data_dir)} rows.")
+    elif args.restore:
+        for employee_id in args.restore:
+            print(f"{employee_id}: {'restored' if restore_employee(data_dir, employee_id) else 'not deleted'}")
+    for row in load(data_dir).itertuples():
+        print(f"{row.employee_id}: {row.name} ({row.department}), deleted {row.deleted_at}"
+              f"{'' if row.compacted else ', not compacted yet'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+from utils import storage
+
+EMPLOYEE_YOY_FILE = "yoy_employee.csv"
+DEPARTMENT_YOY_FILE = "yoy_department.csv"
+YOY_META_FILE = "yoy_meta.json"
+DERIVED = storage.DerivedTable("yoy", YOY_META_FILE)
+
+EMPLOYEE_KEYS = ["employee_id", "criteria"]
+DEPARTMENT_KEYS = ["department", "criteria"]
+SUM_COLUMNS = ["score_sum", "score_count"]
+
+# Changes in mean score smaller than this are flagged as unchanged
+CHANGE_THRESHOLD = 0.05
+
+
+def _yearly_sums(rows, keys):
+    scored = rows.dropna(subset=["score"])
+    return (
+        scored.groupby(keys + ["evaluation_year"], dropna=False)["score"]
+        .agg(score_sum="sum", score_count="count")
+        .reset_index()
+    )
+
+
+def _with_deltas(table, keys):
+    table = table.sort_values(keys + ["evaluation_year"], kind="stable").reset_index(drop=True)
+    table["score_mean"] = table["score_sum"] / table["score_count"]
+    grouped = table.groupby(keys, dropna=False, sort=False)
+    table["prev_year"] = grouped["evaluation_year"].shift()
+    table["delta"] = table["score_mean"] - grouped["score_mean"].shift()
+    table["trend"] = np.select(
+        [table["delta"] >= CHANGE_THRESHOLD, table["delta"] <= -CHANGE_THRESHOLD, table["delta"].notna()],
+        ["improved", "declined", "unchanged"],
+        default="",
+    )
+    return table
+
+
+def _merge_update(table, partial, keys):
+    # Only groups that received new rows need their means and deltas recomputed
+    touched = partial[keys].drop_duplicates()
+    marked = table.merge(touched.assign(_touched=True), on=keys, how="left")
+    is_touched = marked["_touched"].notna().to_numpy()
+    untouched = table[~is_touched]
+
+    cols = keys + ["evaluation_year"]
+    refreshed = (
+        pd.concat([table.loc[is_touched, cols + SUM_COLUMNS], partial], ignore_index=True)
+        .groupby(cols, dropna=False)[SUM_COLUMNS].sum()
+        .reset_index()
+    )
+    return pd.concat([untouched, _with_deltas(refreshed, keys)], ignore_index=True)
+
+
+def _save(data_dir, employee_yoy, department_yoy, source):
+    storage.replace_file(storage.path(data_dir, EMPLOYEE_YOY_FILE), lambda p: employee_yoy.to_csv(p, index=False))
+    storage.replace_file(storage.path(data_dir, DEPARTMENT_YOY_FILE), lambda p: department_yoy.to_csv(p, index=False))
+    DERIVED.save_meta(data_dir, source)
+
+
+def _parallel_yearly_sums(data_dir, keys):
+    from utils import engine
+
+    stats = engine.group_stats(data_dir, keys + ["evaluation_year"], "score")
+    return stats.rename(columns={"sum": "score_sum", "count": "score_count"})[keys + ["evaluation_year"] + SUM_COLUMNS]
+
+
+def _build(data_dir):
+    # Both tables from the full evaluation history of the snapshot the thread reads
+    from utils import engine
+
+    if engine.use_parallel(data_dir):
+        # Large histories are aggregated from the files in worker processes instead
+        employee_sums = _parallel_yearly_sums(data_dir, EMPLOYEE_KEYS)
+        department_sums = _parallel_yearly_sums(data_dir, DEPARTMENT_KEYS)
+    else:
+        eval_df = storage.load_history(data_dir)
+        employee_sums = _yearly_sums(eval_df, EMPLOYEE_KEYS)
+        department_sums = _yearly_sums(eval_df, DEPARTMENT_KEYS)
+    return _with_deltas(employee_sums, EMPLOYEE_KEYS), _with_deltas(department_sums, DEPARTMENT_KEYS)
+
+
+def rebuild(data_dir):
+    """Build both year-over-year tables from the full evaluation history, archived years included.
+
+    The caller holds the write lock.
+    """
+    source = storage.evaluation_source(data_dir)
+    employee_yoy, department_yoy = _build(data_dir)
+    _save(data_dir, employee_yoy, department_yoy, source)
+    return employee_yoy, department_yoy
+
+
+def update(data_dir, new_rows, previous_source):
+    """Fold newly submitted rows into the stored tables without rescanning history.
+
+    previous_source is storage.evaluation_source from before the rows were appended; tables
+    that were already stale are left for `load` to rebuild. The caller holds the write lock.
+    """
+    if not DERIVED.is_current(data_dir, previous_source):
+        return None
+    employee_yoy, department_yoy = _read_tables(data_dir)
+
+    employee_yoy = _merge_update(employee_yoy, _yearly_sums(new_rows, EMPLOYEE_KEYS), EMPLOYEE_KEYS)
+    department_yoy = _merge_update(department_yoy, _yearly_sums(new_rows, DEPARTMENT_KEYS), DEPARTMENT_KEYS)
+    _save(data_dir, employee_yoy, department_yoy, storage.evaluation_source(data_dir))
+    return employee_yoy, department_yoy
+
+
+def _table_paths(data_dir):
+    return [storage.path(data_dir, name) for name in (EMPLOYEE_YOY_FILE, DEPARTMENT_YOY_FILE, YOY_META_FILE)]
+
+
+def _read_tables(data_dir):
+    # Keys are identifiers even when they look numeric, as in the evaluation file
+    dtype = {"employee_id": "str", "department": "str", "criteria": "str", "trend": "str"}
+    return (pd.read_csv(storage.source(data_dir, EMPLOYEE_YOY_FILE), dtype=dtype),
+            pd.read_csv(storage.source(data_dir, DEPARTMENT_YOY_FILE), dtype=dtype))
+
+
+def load(data_dir):
+    """Return (employee_yoy, department_yoy), rebuilding them if they are missing or stale.
+
+    Staleness is judged from metadata (see storage.evaluation_source), so a rerun with
+    current tables never reads evaluation rows. The tables are published with the data
+    files, and a stale version is served rather than waiting for a writer to finish
+    (see storage.DerivedTable.load).
+    """
+    def read(data_dir):
+        return storage.cached(data_dir, "yoy", _table_paths(data_dir), lambda: _read_tables(data_dir))
+
+    return DERIVED.load(data_dir, rebuild, _build, read)
+
+
+def yearly_means(department_yoy, criteria):
+    """Company-wide yearly mean per criterion, combined from the department table."""
+    selected = department_yoy[department_yoy["criteria"].isin(criteria)]
+    summary = selected.groupby(["evaluation_year", "criteria"])[SUM_COLUMNS].sum().reset_index()
+    return _with_deltas(summary, ["criteria"]).rename(columns={"score_mean": "score"})
+
+
+def biggest_movers(employee_yoy, year, criteria, top_n=10):
+    """Employees with the largest average change across criteria in the given year."""
+    changes = employee_yoy[
+        (employee_yoy["evaluation_year"] == year)
+        & employee_yoy["delta"].notna()
+        & employee_yoy["criteria"].isin(criteria)
+    ].assign(
+        improved=lambda df: df["trend"] == "improved",
+        declined=lambda df: df["trend"] == "declined",
+    )
+    movers = (
+        changes.groupby("employee_id")
+        .agg(avg_delta=("delta", "mean"), criteria_improved=("improved", "sum"), criteria_declined=("declined", "sum"))
+        .reset_index()
+    )
+    improving = movers[movers["avg_delta"] > 0].nlargest(top_n, "avg_delta")
+    declining = movers[movers["avg_delta"] < 0].nsmallest(top_n, "avg_delta")
+    return improving, declining
@@ -0,0 +1,47 @@
+import os
+import threading
+
+_started = set()
+_started_lock = threading.Lock()
+
+
+def _warm(data_dir):
+    # Same order as a dashboard view: chart modules, then the tenant's datasets and tables
+    import plotly.express  # noqa: F401
+    import plotly.graph_objects  # noqa: F401
+
+    from utils import aggregates, coverage, engine, sketches, snapshot, storage, trends
+
+    snapshot.pin(data_dir)
+    storage.load_employees(data_dir)
+    if not engine.use_parallel(data_dir, include_archived=False):
+        # Large data is aggregated from the files instead of held in memory
+        storage.load_evaluations(data_dir)
+    trends.load(data_dir)
+    sketches.load(data_dir)
+    coverage.load(data_dir)
+    for name in aggregates.SUMMARY_BUILDERS:
+        aggregates._aggregate(data_dir, name)
+
+
+def _run(data_dir):
+    try:
+        _warm(data_dir)
+    except Exception:
+        # Best effort only: the page that needs the data reports any error itself
+        with _started_lock:
+            _started.discard(os.path.abspath(data_dir))
+
+
+def start(data_dir):
+    """Load plotly and the tenant's data into this process in a background thread, once per tenant.
+
+    Landing pages call this so that a freshly started server has the dashboards' modules
+    and cached tables ready by the time someone opens them.
+    """
+    key = os.path.abspath(data_dir)
+    with _started_lock:
+        if key in _started:
+            return
+        _started.add(key)
+    threading.Thread(target=_run, args=(data_dir,), name="perf-track-warmup", daemon=True).start()